@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -17,12 +17,63 @@ class Settings(BaseSettings):
     # Application Settings
     MAX_CONVERSATION_HISTORY: int = 10
     SESSION_TIMEOUT_HOURS: int = 24
+    SESSION_SHARDS: int = 32
+    SESSION_REAPER_INTERVAL_SECONDS: int = 60
+    SESSION_MAX_RESIDENT: int = 0  # 0 = unlimited
+    SESSION_MAX_RESIDENT_BYTES: int = 0  # 0 = unlimited
+    SESSION_STORE_BACKEND: str = "memory"  # memory, sqlite or redis
+    SESSION_STORE_PATH: str = "./session_store.sqlite3"
+    REDIS_URL: str = "redis://localhost:6379/0"
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
     LOG_LEVEL: str = "INFO"
+    GEMINI_MAX_CONCURRENCY: int = 16
+    GEMINI_STATELESS_PROMPTS: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 8000
+    CONTEXT_TOKEN_COUNTER: str = "estimate"
+    ROLLING_SUMMARY_ENABLED: bool = True
+    SUMMARY_TRIGGER_MESSAGES: int = 12
+    SUMMARY_KEEP_RECENT: int = 6
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_SIZE: int = 1000
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    SEMANTIC_CACHE_MAX_PRIOR_MESSAGES: int = 0  # 0 = opening messages only
+    SEMANTIC_CACHE_MAX_WORDS: int = 12
 
     # RAG System Settings
     RAG_N_RESULTS: int = 3
-    BATCH_SIZE: int = 100
+    HYBRID_RETRIEVAL: bool = True
+    HYBRID_CANDIDATES: int = 20  # per retriever, before fusion
+    BM25_MAX_DF_RATIO: float = 0.5  # skip query terms found in more than this share of documents
+    RRF_K: int = 60
+    MMR_ENABLED: bool = False
+    MMR_LAMBDA: float = 0.7  # 1.0 = pure relevance
+    MMR_CANDIDATE_MULTIPLIER: int = 4
+    MMR_MAX_PER_SOURCE: int = 0  # 0 = no cap
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_SIZE: int = 2048
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 3600
+    RAG_METADATA_FIELDS: List[str] = ["source", "split"]  # dataset columns kept as vector metadata
+    BATCH_SIZE: int = 512
+    DATASET_STREAMING: bool = True
+    NEAR_DEDUP_ENABLED: bool = False  # keeps ~2 KB per unique record in memory for the whole ingest run
+    NEAR_DEDUP_THRESHOLD: float = 0.8
+    CHUNK_MAX_WORDS: int = 180
+    CHUNK_OVERLAP_WORDS: int = 40
+    RAG_CHUNK_CONTEXT_WORDS: int = 50
+    VECTOR_BACKEND: str = "chroma"  # "chroma" or "numpy"
+    NUMPY_STORE_USE_FAISS: bool = True
+    NUMPY_STORE_FAISS_NLIST: int = 0  # 0 = exact flat index
+    VECTOR_INDEX_MODE: str = "hnsw"  # "hnsw" or "quantized"
+    QUANTIZED_BINARY_CANDIDATES: int = 2000
+    QUANTIZED_RERANK_CANDIDATES: int = 100
+    INGEST_WORKERS: int = 4
+    INGEST_QUEUE_SIZE: int = 8
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 3.0
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_TTL_SECONDS: int = 86400
+    EMBEDDING_CACHE_PATH: Optional[str] = None
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,127 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils.logger import therapist_logger
+from .config import settings
+
+TokenCounter = Callable[[str], int]
+
+# Rough per-message cost of role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: str) -> int:
+    """Fast local estimate: about four characters per token for English text"""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+def word_tokens(text: str) -> int:
+    """Word-based estimate: about four tokens for every three words"""
+    if not text:
+        return 0
+    return (len(text.split()) * 4 + 2) // 3
+
+TOKEN_COUNTERS: Dict[str, TokenCounter] = {
+    "estimate": estimate_tokens,
+    "words": word_tokens
+}
+
+def get_token_counter(name: str = None) -> TokenCounter:
+    """Look up a registered token counter by name"""
+    name = name or settings.CONTEXT_TOKEN_COUNTER
+    if name not in TOKEN_COUNTERS:
+        raise ValueError(f"Unknown token counter: {name}")
+    return TOKEN_COUNTERS[name]
+
+@dataclass
+class ContextWindow:
+    """Prompt parts selected to fit within a token budget"""
+    system_prompt: str
+    user_message: str
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+    examples: List[Dict[str, Any]] = field(default_factory=list)
+    summary: Optional[str] = None
+    token_count: int = 0
+    dropped_turns: int = 0
+    dropped_examples: int = 0
+
+class ContextWindowManager:
+    """
+    Fits the system prompt, conversation history and RAG examples into a token budget
+
+    Parts are admitted in priority order: system prompt, current message,
+    running session summary, recent turns (newest first), then RAG examples
+    (best match first). The system prompt and current message are always
+    included.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = None,
+        token_counter: Optional[TokenCounter] = None
+    ):
+        self.logger = therapist_logger.getChild("ContextWindowManager")
+        self.token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+        self.count_tokens = token_counter or get_token_counter()
+
+    def _message_tokens(self, text: str) -> int:
+        return self.count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(
+        self,
+        system_prompt: str,
+        user_message: str,
+        history: List[Dict[str, Any]],
+        examples: Optional[List[Dict[str, Any]]] = None,
+        summary: Optional[str] = None
+    ) -> ContextWindow:
+        """Select the summary, history turns and examples that fit the budget"""
+        examples = examples or []
+        used = self.count_tokens(system_prompt) + self._message_tokens(user_message)
+
+        if summary:
+            cost = self._message_tokens(summary)
+            if used + cost <= self.token_budget:
+                used += cost
+            else:
+                summary = None
+
+        # Recent turns, newest first; stop at the first that does not fit so
+        # the kept history stays contiguous
+        turns: List[Dict[str, Any]] = []
+        for msg in reversed(history):
+            cost = self._message_tokens(msg["content"])
+            if used + cost > self.token_budget:
+                break
+            turns.append(msg)
+            used += cost
+        turns.reverse()
+
+        # RAG examples in rank order; a long example may be skipped in favour
+        # of shorter ones further down
+        kept_examples: List[Dict[str, Any]] = []
+        for example in examples:
+            cost = self._message_tokens(example["text"])
+            if used + cost > self.token_budget:
+                continue
+            kept_examples.append(example)
+            used += cost
+
+        window = ContextWindow(
+            system_prompt=system_prompt,
+            user_message=user_message,
+            turns=turns,
+            examples=kept_examples,
+            summary=summary,
+            token_count=used,
+            dropped_turns=len(history) - len(turns),
+            dropped_examples=len(examples) - len(kept_examples)
+        )
+
+        if window.dropped_turns or window.dropped_examples:
+            self.logger.debug(
+                f"Context window: {window.token_count}/{self.token_budget} tokens, "
+                f"dropped {window.dropped_turns} turns and {window.dropped_examples} examples"
+            )
+
+        return window
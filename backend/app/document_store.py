@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, List, Tuple
+
+from app.utils.logger import rag_logger
+
+class DocumentStore:
+    """
+    Compressed side store for full document texts, keyed by document ID
+
+    The vector store only holds embeddings and slim metadata; texts are
+    kept here zlib-compressed and fetched by ID for the few results a query
+    returns. Chunks are not stored separately: a chunk's text is a word
+    span of its parent document.
+    """
+
+    def __init__(self, path: str):
+        self.logger = rag_logger.getChild("DocumentStore")
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, text BLOB NOT NULL)")
+        self._db.commit()
+
+    def put_many(self, documents: Iterable[Tuple[str, str]]) -> None:
+        """Store (id, text) pairs, replacing existing IDs"""
+        rows = [(doc_id, zlib.compress(text.encode("utf-8"))) for doc_id, text in documents]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO documents (id, text) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        """Texts for the given IDs; missing IDs are left out"""
+        texts = {}
+        unique = list(dict.fromkeys(ids))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for doc_id, blob in self._db.execute(
+                    f"SELECT id, text FROM documents WHERE id IN ({placeholders})", chunk
+                ):
+                    texts[doc_id] = zlib.decompress(blob).decode("utf-8")
+        return texts
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .utils.cache import TTLCache
+from .utils.logger import rag_logger
+from .config import settings
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different inputs share a cache key"""
+    return " ".join(query.lower().split())
+
+class QueryEmbeddingCache:
+    """
+    LRU/TTL cache of query embeddings keyed on normalized query text
+
+    An optional SQLite file backs the in-memory cache so embeddings survive
+    restarts. Entries are namespaced by embedding model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = None,
+        max_size: int = None,
+        ttl_seconds: int = None,
+        disk_path: Optional[str] = None
+    ):
+        self.logger = rag_logger.getChild("QueryEmbeddingCache")
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.ttl_seconds = ttl_seconds or settings.EMBEDDING_CACHE_TTL_SECONDS
+        self.memory = TTLCache(
+            max_size=max_size or settings.EMBEDDING_CACHE_SIZE,
+            ttl_seconds=self.ttl_seconds
+        )
+        self.disk_hits = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = Lock()
+        disk_path = disk_path if disk_path is not None else settings.EMBEDDING_CACHE_PATH
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, embedding BLOB, created_at REAL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a query, if any"""
+        key = normalize_query(query)
+        embedding = self.memory.get(key)
+        if embedding is not None or self._db is None:
+            return embedding
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT embedding, created_at FROM query_embeddings WHERE model = ? AND query = ?",
+                (self.model_name, key)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+
+        embedding = np.frombuffer(row[0], dtype=np.float32)
+        self.memory.set(key, embedding)
+        self.disk_hits += 1
+        return embedding
+
+    def set(self, query: str, embedding: Any) -> None:
+        """Cache the embedding for a query"""
+        key = normalize_query(query)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self.memory.set(key, embedding)
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                        (self.model_name, key, embedding.tobytes(), time.time())
+                    )
+                    self._db.commit()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing embedding cache: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for the cache"""
+        stats = self.memory.get_stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["persistent"] = self._db is not None
+        return stats
@@ -0,0 +1,98 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+from .config import settings
+
+class BatchingEmbedder:
+    """
+    Coalesces concurrent query encodes into batched SentenceTransformer calls
+
+    Callers await encode() for a single text. A worker task collects requests
+    for up to max_wait_ms or max_batch_size items, encodes them as one batch
+    on a dedicated thread and resolves each caller's future, so the event
+    loop never runs the model itself.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        max_batch_size: int = None,
+        max_wait_ms: float = None
+    ):
+        self.logger = rag_logger.getChild("BatchingEmbedder")
+        self.model = model
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_BATCH_MAX_WAIT_MS) / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self) -> None:
+        """Start the batching worker on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Embed one text, batched with any concurrent callers"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or the window closes"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await self._loop.run_in_executor(
+                    self._executor, self.model.encode, texts
+                )
+            except Exception as e:
+                self.logger.error(f"Error encoding batch of {len(texts)}: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(np.asarray(embedding))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return batching counters"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,74 @@
+import asyncio
+from contextlib import asynccontextmanager
+from threading import Lock
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+from .utils.logger import therapist_logger
+from .config import settings
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "top_k": 40
+}
+
+class GeminiClientPool:
+    """Process-wide pool of Gemini models shared by all therapy sessions"""
+
+    def __init__(self, api_key: str, max_concurrency: int = None):
+        self.logger = therapist_logger.getChild("GeminiClientPool")
+        self.max_concurrency = max_concurrency or settings.GEMINI_MAX_CONCURRENCY
+        self._models: Dict[Tuple[str, Optional[str]], genai.GenerativeModel] = {}
+        self._lock = Lock()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+
+        # Configure the SDK once for the whole process
+        genai.configure(api_key=api_key)
+
+    def get_model(
+        self,
+        model_name: str = None,
+        system_instruction: Optional[str] = None
+    ) -> genai.GenerativeModel:
+        """Return the shared model for a model name and system instruction, creating it on first use"""
+        model_name = model_name or settings.GEMINI_MODEL
+        key = (model_name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=GENERATION_CONFIG,
+                    system_instruction=system_instruction
+                )
+                self._models[key] = model
+                self.logger.info(f"Created shared Gemini model: {model_name}")
+            return model
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        model_name: str = None,
+        system_instruction: Optional[str] = None
+    ) -> AsyncIterator[genai.GenerativeModel]:
+        """Borrow a model for one request, waiting if the concurrency cap is reached"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                yield self.get_model(model_name, system_instruction)
+            finally:
+                self.in_flight -= 1
+
+_client_pool: Optional[GeminiClientPool] = None
+_client_pool_lock = Lock()
+
+def get_client_pool(api_key: str = None) -> GeminiClientPool:
+    """Return the process-wide Gemini client pool"""
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            _client_pool = GeminiClientPool(api_key or settings.GEMINI_API_KEY)
+        return _client_pool
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from app.utils.logger import rag_logger
+from app.config import settings
+
+def content_id(text: str) -> str:
+    """Stable document ID derived from the normalized text content"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def _spool_path(spool_dir: str, dataset_name: str) -> str:
+    return os.path.join(spool_dir, re.sub(r"[^A-Za-z0-9_.-]", "__", dataset_name) + ".jsonl")
+
+def _spool_dataset(dataset_name: str, spool_path: str) -> int:
+    """Stream and clean one dataset in a worker process, writing records to a JSONL spool file"""
+    from app.rag_system import TherapyDatasetProcessor
+
+    count = 0
+    tmp_path = spool_path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in TherapyDatasetProcessor().iter_dataset(dataset_name):
+                for doc in chunk:
+                    doc["id"] = content_id(doc["text"])
+                    f.write(json.dumps(doc, default=str) + "\n")
+                count += len(chunk)
+    except Exception:
+        # A partial spool must never be mistaken for a finished one
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, spool_path)
+    return count
+
+class IngestionCheckpoint:
+    """Per-dataset ingest progress persisted as JSON so an interrupted run can resume"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.datasets = json.load(f).get("datasets", {})
+
+    def get(self, dataset_name: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.datasets.get(dataset_name, {}))
+
+    def update(self, dataset_name: str, **fields: Any) -> None:
+        with self._lock:
+            self.datasets.setdefault(dataset_name, {}).update(fields)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"datasets": self.datasets}, f)
+            os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.datasets = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+class IngestionPipeline:
+    """
+    Pipelined, resumable dataset ingestion
+
+    Stages:
+    1. A process pool loads and cleans datasets in parallel, spooling each
+       one to a JSONL file under the work directory.
+    2. The calling thread dedupes, chunks and embeds spooled records in
+       batches as soon as each dataset is ready.
+    3. A writer thread adds embedded batches to the vector store, fed through
+       a bounded queue so embedding and writes overlap. With a document
+       store, full parent texts go there and the vector store only keeps
+       embeddings and metadata. With a lexical index, chunk texts are also
+       added to it for BM25 search.
+
+    Documents are keyed by a hash of their normalized text. Exact and near
+    duplicates across datasets are dropped before embedding, texts already
+    in the vector store are skipped, and writes use upsert, so re-indexing is
+    incremental. Near-duplicate state lives in memory for one run only.
+
+    Progress is checkpointed after every written batch. Re-running after a
+    crash skips finished datasets and the records already written. A
+    dataset that fails to load is marked failed and skipped while the
+    others are indexed; the run only raises if every dataset fails. An
+    optional progress callback receives per-dataset updates as
+    ``progress(dataset_name, **fields)``; it is called from the writer
+    thread as well as the calling thread.
+    """
+
+    def __init__(
+        self,
+        vector_store: Any,
+        embedding_model: Any,
+        work_dir: str,
+        document_store: Any = None,
+        lexical_index: Any = None,
+        batch_size: int = None,
+        workers: int = None,
+        queue_size: int = None,
+        processor: Any = None,
+        progress: Optional[Callable[..., None]] = None
+    ):
+        from app.rag_system import TherapyDatasetProcessor
+
+        self.logger = rag_logger.getChild("IngestionPipeline")
+        self.processor = processor or TherapyDatasetProcessor()
+        self.vector_store = vector_store
+        self.document_store = document_store
+        self.lexical_index = lexical_index
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size or settings.BATCH_SIZE
+        self.workers = workers or settings.INGEST_WORKERS
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+        self.progress = progress
+
+        self.spool_dir = os.path.join(work_dir, "ingest_spool")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.checkpoint = IngestionCheckpoint(os.path.join(work_dir, "ingest_checkpoint.json"))
+
+        # Content IDs seen during this run, for cross-dataset deduplication
+        self._seen_ids: Set[str] = set()
+        self.duplicates_skipped = 0
+        self.near_duplicates_skipped = 0
+        self.already_indexed = 0
+
+    def _report(self, dataset_name: str, **fields: Any) -> None:
+        """Forward a progress update to the callback, if any"""
+        if self.progress is None:
+            return
+        try:
+            self.progress(dataset_name, **fields)
+        except Exception as e:
+            self.logger.warning(f"Progress callback failed: {str(e)}")
+
+    def _iter_batches(self, spool_path: str, skip: int) -> Iterator[List[Dict[str, Any]]]:
+        """Stream spooled records in batches, skipping records already written"""
+        batch: List[Dict[str, Any]] = []
+        with open(spool_path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if line_no < skip:
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _write_loop(self, write_queue: "queue.Queue", errors: List[Exception]) -> None:
+        """Writer stage: add embedded batches to the vector store and checkpoint them"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            try:
+                # Texts land before their vectors so a searchable ID always has a document
+                if self.document_store is not None:
+                    self.document_store.put_many(item["parents"])
+                if self.lexical_index is not None:
+                    self.lexical_index.add(item["chunks"])
+                if item["ids"]:
+                    self.vector_store.upsert(
+                        documents=None if self.document_store is not None else item["texts"],
+                        embeddings=item["embeddings"],
+                        ids=item["ids"],
+                        metadatas=item["metadatas"]
+                    )
+                self.checkpoint.update(item["dataset"], records_done=item["records_done"])
+                self._report(
+                    item["dataset"],
+                    records_done=item["records_done"],
+                    documents_added=len(item["ids"])
+                )
+                if item["last"]:
+                    self.checkpoint.update(item["dataset"], completed=True)
+                    self._report(item["dataset"], status="completed")
+                    os.remove(item["spool_path"])
+            except Exception as e:
+                self.logger.error(f"Error writing batch for {item['dataset']}: {str(e)}")
+                errors.append(e)
+
+    def _dedupe_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop exact and near duplicates seen earlier in this run"""
+        unique = []
+        for doc in batch:
+            if doc["id"] in self._seen_ids:
+                self.duplicates_skipped += 1
+                continue
+            self._seen_ids.add(doc["id"])
+            unique.append(doc)
+
+        near_unique = self.processor.filter_near_duplicates(unique)
+        self.near_duplicates_skipped += len(unique) - len(near_unique)
+        return near_unique
+
+    def _skip_indexed(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop documents whose IDs are already in the vector store"""
+        if not docs:
+            return docs
+
+        existing = set(self.vector_store.get(ids=[doc["id"] for doc in docs], include=[])["ids"])
+        self.already_indexed += len(existing)
+        return [doc for doc in docs if doc["id"] not in existing]
+
+    def _embed_dataset(
+        self,
+        dataset_name: str,
+        spool_path: str,
+        write_queue: "queue.Queue",
+        errors: List[Exception]
+    ) -> int:
+        """Embedding stage for one spooled dataset; returns documents queued for writing"""
+        records_done = self.checkpoint.get(dataset_name).get("records_done", 0)
+        total = self.checkpoint.get(dataset_name).get("spooled", 0)
+        queued = 0
+
+        if records_done >= total:
+            # Nothing left to embed: an empty dataset, or a crash right after the last write
+            self.checkpoint.update(dataset_name, completed=True)
+            self._report(dataset_name, status="completed")
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+            return 0
+
+        self._report(dataset_name, status="embedding", spooled=total, records_done=records_done)
+
+        for batch in self._iter_batches(spool_path, records_done):
+            if errors:
+                break
+            records_done += len(batch)
+            records = self._dedupe_batch(batch)
+            chunks = self.processor.chunk_records(records)
+            docs = self._skip_indexed(chunks)
+            texts = [doc["text"] for doc in docs]
+            embeddings = self.embedding_model.encode(texts).tolist() if texts else []
+            write_queue.put({
+                "dataset": dataset_name,
+                "texts": texts,
+                # Texts and lexical entries cover already-embedded documents too, so
+                # re-running ingest backfills the side stores without re-embedding
+                "parents": [(r["id"], r["text"]) for r in records],
+                "chunks": [(c["id"], c["text"]) for c in chunks],
+                "embeddings": embeddings,
+                "ids": [doc["id"] for doc in docs],
+                "metadatas": [doc["metadata"] for doc in docs],
+                "records_done": records_done,
+                "last": records_done >= total,
+                "spool_path": spool_path
+            })
+            queued += len(docs)
+
+        return queued
+
+    def run(self, dataset_names: Optional[List[str]] = None) -> int:
+        """Run the pipeline over the given datasets; returns the number of documents indexed"""
+        from app.rag_system import TherapyDatasetProcessor
+
+        dataset_names = dataset_names or list(TherapyDatasetProcessor.DATASET_CONFIGS.keys())
+        pending = [name for name in dataset_names if not self.checkpoint.get(name).get("completed")]
+        if len(pending) < len(dataset_names):
+            self.logger.info(f"Resuming ingest: {len(dataset_names) - len(pending)} datasets already indexed")
+        for name in dataset_names:
+            self._report(name, status="loading" if name in pending else "completed")
+
+        write_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        errors: List[Exception] = []
+        writer = threading.Thread(target=self._write_loop, args=(write_queue, errors), daemon=True)
+        writer.start()
+
+        total_documents = 0
+        failed: Dict[str, str] = {}
+        start_time = time.perf_counter()
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            try:
+                ready = []
+                futures = {}
+                for name in pending:
+                    path = _spool_path(self.spool_dir, name)
+                    if "spooled" in self.checkpoint.get(name) and os.path.exists(path):
+                        ready.append(name)
+                    else:
+                        futures[executor.submit(_spool_dataset, name, path)] = name
+
+                # Already-spooled datasets first, then the rest as they finish loading
+                for name in ready:
+                    total_documents += self._embed_dataset(
+                        name, _spool_path(self.spool_dir, name), write_queue, errors
+                    )
+                for future in as_completed(futures):
+                    if errors:
+                        break
+                    name = futures[future]
+                    try:
+                        count = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error loading dataset {name}: {str(e)}")
+                        failed[name] = str(e)
+                        self.checkpoint.update(name, failed=True, error=str(e))
+                        self._report(name, status="failed", error=str(e))
+                        continue
+                    self.checkpoint.update(name, spooled=count, records_done=0, failed=False, error=None)
+                    self.logger.info(f"Loaded {count} entries from {name}")
+                    total_documents += self._embed_dataset(
+                        name, _spool_path(self.spool_dir, name), write_queue, errors
+                    )
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+        finally:
+            write_queue.put(None)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        if pending and len(failed) == len(pending):
+            raise RuntimeError(f"All {len(failed)} datasets failed to load: {failed}")
+
+        # A finished run leaves nothing to resume; failed datasets keep the
+        # checkpoint so the next run retries only them
+        if failed:
+            self.logger.warning(f"Skipped {len(failed)} datasets that failed to load: {sorted(failed)}")
+        else:
+            self.checkpoint.clear()
+        elapsed = time.perf_counter() - start_time
+        self.logger.info(
+            f"Indexed {total_documents} documents in {elapsed:.1f}s "
+            f"({total_documents / elapsed if elapsed else 0:.0f} docs/s); skipped "
+            f"{self.duplicates_skipped} duplicates, {self.near_duplicates_skipped} near duplicates "
+            f"and {self.already_indexed} already indexed"
+        )
+        return total_documents
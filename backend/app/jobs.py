@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.utils.logger import rag_logger
+
+class IndexingJob:
+    """Progress of one background indexing run, updated from the ingest threads"""
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = "pending"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.documents_indexed = 0
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self._started = 0.0
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, dataset_name: str, documents_added: int = 0, **fields: Any) -> None:
+        """Progress callback for IngestionPipeline"""
+        with self._lock:
+            self.datasets.setdefault(dataset_name, {}).update(fields)
+            self.documents_indexed += documents_added
+
+    def mark_running(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now()
+            self._started = time.monotonic()
+
+    def mark_finished(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = "failed" if error else "completed"
+            self.error = error
+            self.finished_at = datetime.now()
+            self._finished = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot with throughput and ETA derived from per-dataset progress"""
+        with self._lock:
+            elapsed = ((self._finished or time.monotonic()) - self._started) if self.started_at else 0.0
+            records_done = sum(d.get("records_done", 0) for d in self.datasets.values())
+            records_total = sum(d.get("spooled", 0) for d in self.datasets.values())
+            records_per_second = records_done / elapsed if elapsed else 0.0
+
+            # Datasets still loading have no record count yet, so the ETA covers loaded ones only
+            eta_seconds = None
+            if self.status == "running" and records_per_second:
+                eta_seconds = (records_total - records_done) / records_per_second
+
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": elapsed,
+                "documents_indexed": self.documents_indexed,
+                "documents_per_second": self.documents_indexed / elapsed if elapsed else 0.0,
+                "records_processed": records_done,
+                "records_total": records_total,
+                "eta_seconds": eta_seconds,
+                "datasets_loading": sum(1 for d in self.datasets.values() if d.get("status") == "loading"),
+                "datasets_failed": sum(1 for d in self.datasets.values() if d.get("status") == "failed"),
+                "datasets": {name: dict(progress) for name, progress in self.datasets.items()},
+                "error": self.error
+            }
+
+class IndexingJobManager:
+    """
+    Runs indexing jobs in the background and keeps their progress
+
+    Only one job runs at a time; starting while one is active returns the
+    active job. The work itself runs in worker threads and processes, so
+    the event loop keeps serving requests.
+    """
+
+    def __init__(self, max_jobs: int = 20):
+        self.logger = rag_logger.getChild("IndexingJobManager")
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, IndexingJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def active_job(self) -> Optional[IndexingJob]:
+        for job in self.jobs.values():
+            if job.status in ("pending", "running"):
+                return job
+        return None
+
+    def start(self, run: Callable[[IndexingJob], Awaitable[Any]]) -> IndexingJob:
+        """Start ``run(job)`` as a background task, unless a job is already active"""
+        job = self.active_job()
+        if job is not None:
+            return job
+
+        job = IndexingJob()
+        self.jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, run))
+
+        # Keep the most recent jobs only
+        for old_id in list(self.jobs)[:-self.max_jobs]:
+            if old_id not in self._tasks:
+                del self.jobs[old_id]
+        return job
+
+    async def _run(self, job: IndexingJob, run: Callable[[IndexingJob], Awaitable[Any]]) -> None:
+        job.mark_running()
+        self.logger.info(f"Indexing job {job.id} started")
+        try:
+            await run(job)
+            job.mark_finished()
+            self.logger.info(f"Indexing job {job.id} completed: {job.documents_indexed} documents")
+        except Exception as e:
+            self.logger.error(f"Indexing job {job.id} failed: {str(e)}")
+            job.mark_finished(error=str(e))
+        finally:
+            self._tasks.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[IndexingJob]:
+        return self.jobs.get(job_id)
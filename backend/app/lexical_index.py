@@ -0,0 +1,170 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.utils.logger import rag_logger
+from app.config import settings
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about after again all am an and any are as at be because been before being between both but by can
+could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now
+of off on once only or other our ours ourselves out over own same she should so some such than that
+the their theirs them themselves then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours yourself
+yourselves i'm it's don't
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens with stopwords removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index over document texts
+
+    Postings live in a SQLite table clustered by term, so a query reads
+    only the posting lists of its own terms. Document IDs are content
+    hashes, so a document that is already indexed has identical postings
+    and re-adding it is a no-op.
+
+    Searches score in SQL and return only the top k. Terms found in more
+    than ``max_df_ratio`` of the documents are skipped, as their posting
+    lists are the longest while their IDF is close to zero. Reads use a
+    read-only connection per thread, so they run concurrently with each
+    other and with writes; only writes take the lock.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, max_df_ratio: float = None):
+        self.logger = rag_logger.getChild("BM25Index")
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio if max_df_ratio is not None else settings.BM25_MAX_DF_RATIO
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT, doc INTEGER, tf INTEGER, "
+            "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID")
+        # Indexes built before document frequencies were tracked
+        if self._db.execute("SELECT NOT EXISTS (SELECT 1 FROM terms) AND EXISTS (SELECT 1 FROM postings)").fetchone()[0]:
+            self._db.execute("INSERT INTO terms (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+        self._db.commit()
+        # (version, document count, average length); tagged with the version
+        # so a read racing an add cannot cache stale stats
+        self._stats: Optional[Tuple[int, int, float]] = None
+        # Bumped whenever documents are added
+        self.version = 0
+
+    def _doc_numbers(self, ids: List[str]) -> Dict[str, int]:
+        """Internal document numbers for the IDs that are indexed"""
+        numbers = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            numbers.update(self._db.execute(
+                f"SELECT id, doc FROM docs WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+        return numbers
+
+    def add(self, documents: Sequence[Tuple[str, str]]) -> int:
+        """Index (id, text) pairs, skipping IDs already indexed; returns the number added"""
+        with self._lock:
+            existing = self._doc_numbers([doc_id for doc_id, _ in documents])
+            new = {}
+            for doc_id, text in documents:
+                if doc_id not in existing:
+                    new[doc_id] = Counter(tokenize(text))
+            if not new:
+                return 0
+
+            self._db.executemany(
+                "INSERT INTO docs (id, length) VALUES (?, ?)",
+                [(doc_id, sum(counts.values())) for doc_id, counts in new.items()]
+            )
+            numbers = self._doc_numbers(list(new))
+            # Sorted by term so inserts walk the clustered index in order
+            self._db.executemany(
+                "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                sorted(
+                    (term, numbers[doc_id], tf)
+                    for doc_id, counts in new.items()
+                    for term, tf in counts.items()
+                )
+            )
+            self._db.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                sorted(Counter(term for counts in new.values() for term in counts).items())
+            )
+            self._db.commit()
+            self.version += 1
+        return len(new)
+
+    def _reader(self) -> sqlite3.Connection:
+        """Read-only connection for the calling thread"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro"
+            db = self._local.db = sqlite3.connect(uri, uri=True)
+        return db
+
+    def _corpus_stats(self) -> Tuple[int, float]:
+        """Document count and average document length"""
+        version = self.version
+        stats = self._stats
+        if stats is None or stats[0] != version:
+            count, total = self._reader().execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            stats = self._stats = (version, count, total / count if count else 0.0)
+        return stats[1], stats[2]
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (id, BM25 score) pairs for a query"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        count, avg_length = self._corpus_stats()
+        if not count:
+            return []
+
+        db = self._reader()
+        placeholders = ",".join("?" * len(terms))
+        dfs = dict(db.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms).fetchall())
+        if not dfs:
+            return []
+        selected = {term: df for term, df in dfs.items() if df <= self.max_df_ratio * count}
+        if not selected:
+            # Every term is common; the rarest still ranks something
+            rarest = min(dfs, key=dfs.get)
+            selected = {rarest: dfs[rarest]}
+
+        idf_params = []
+        for term, df in selected.items():
+            idf_params += [term, math.log(1 + (count - df + 0.5) / (df + 0.5))]
+        values = ",".join(["(?, ?)"] * len(selected))
+        rows = db.execute(
+            f"WITH q (term, idf) AS (VALUES {values}) "
+            "SELECT d.id, SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score "
+            "FROM q JOIN postings p ON p.term = q.term JOIN docs d ON d.doc = p.doc "
+            "GROUP BY p.doc ORDER BY score DESC LIMIT ?",
+            idf_params + [self.k1 + 1, self.k1, self.b, self.b, avg_length, k]
+        ).fetchall()
+        return [(doc_id, score) for doc_id, score in rows]
+
+    def __len__(self) -> int:
+        return self._corpus_stats()[0]
@@ -1,6 +1,10 @@
+import asyncio
+import json
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
 
 from app.config import settings
 from app.models import (
@@ -11,10 +15,14 @@ from app.models import (
     ConversationHistory,
     SummaryRequest,
     SummaryResponse,
-    RAGStats
+    RAGStats,
+    SessionStats,
+    IndexingJobStatus
 )
+from app.jobs import IndexingJobManager
 from app.rag_system import TherapyRAG
 from app.session_manager import SessionManager
+from app.session_store import SessionConflictError
 from app.utils.logger import api_logger
 
 # Initialize FastAPI app
@@ -30,8 +38,9 @@ app.add_middleware(
 )
 
 # Initialize components
-session_manager = SessionManager()
 rag_system = TherapyRAG()
+session_manager = SessionManager(rag_system=rag_system)
+indexing_jobs = IndexingJobManager()
 logger = api_logger.getChild("main")
 
 # Health check endpoint
@@ -43,11 +52,13 @@ async def health_check():
 @app.post("/api/sessions/create", response_model=SessionResponse)
 async def create_session(request: SessionCreate):
     try:
-        session_id = session_manager.create_session(
+        # Session manager calls may hit the session store, so they run off the event loop
+        session_id = await asyncio.to_thread(
+            session_manager.create_session,
             user_id=request.user_id,
             metadata=request.metadata
         )
-        session_data = session_manager.session_metadata[session_id]
+        session_data = await asyncio.to_thread(session_manager.get_session_metadata, session_id)
         return SessionResponse(
             session_id=session_id,
             created_at=session_data["created_at"],
@@ -59,47 +70,106 @@ async def create_session(request: SessionCreate):
 
 @app.delete("/api/sessions/{session_id}")
 async def delete_session(session_id: str):
-    if session_manager.delete_session(session_id):
+    if await asyncio.to_thread(session_manager.delete_session, session_id):
         return {"status": "success", "message": "Session deleted"}
     raise HTTPException(status_code=404, detail="Session not found")
 
+@app.get("/api/sessions/stats", response_model=SessionStats)
+async def get_session_stats():
+    return session_manager.get_stats()
+
 # Chat endpoints
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     try:
-        # Get session
-        therapist = session_manager.get_session(request.session_id)
-        if not therapist:
+        # Unknown IDs are rejected before a turn lock is created for them
+        if await asyncio.to_thread(session_manager.get_session_metadata, request.session_id) is None:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        # Generate response
-        response = await therapist.chat(
-            user_message=request.message,
-            use_rag=request.use_rag,
-            n_examples=request.n_examples
-        )
+        # Turns within one session run one at a time. The session is fetched
+        # under the lock so a copy spilled or replaced while this request
+        # waited is never used.
+        async with session_manager.session_lock(request.session_id):
+            therapist = await asyncio.to_thread(session_manager.get_session, request.session_id)
+            if not therapist:
+                raise HTTPException(status_code=404, detail="Session not found")
+
+            response = await therapist.chat(
+                user_message=request.message,
+                use_rag=request.use_rag,
+                n_examples=request.n_examples
+            )
 
-        # Update session
-        session_manager.increment_message_count(request.session_id)
+            # Update session
+            await asyncio.to_thread(session_manager.increment_message_count, request.session_id)
 
         return ChatResponse(
             response=response["response"],
             session_id=request.session_id,
             timestamp=response["timestamp"],
-            sources_used=response["sources_used"]
+            sources_used=response["sources_used"],
+            token_usage=response["token_usage"],
+            cached=response.get("cached", False)
         )
 
+    except HTTPException:
+        raise
+    except SessionConflictError:
+        raise HTTPException(status_code=409, detail="Session was updated by another request; retry")
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to generate response")
 
+def format_sse(event: Dict[str, Any]) -> str:
+    """Format a therapist stream event as a server-sent event"""
+    payload = {k: v for k, v in event.items() if k != "event"}
+    return f"event: {event['event']}\ndata: {json.dumps(jsonable_encoder(payload))}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    # Check the session exists before the stream starts; the therapist
+    # itself is fetched under the turn lock
+    if await asyncio.to_thread(session_manager.get_session_metadata, request.session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def event_stream():
+        try:
+            async with session_manager.session_lock(request.session_id):
+                therapist = await asyncio.to_thread(session_manager.get_session, request.session_id)
+                if not therapist:
+                    yield format_sse({"event": "error", "detail": "Session not found"})
+                    return
+                async for event in therapist.chat_stream(
+                    user_message=request.message,
+                    use_rag=request.use_rag,
+                    n_examples=request.n_examples
+                ):
+                    if event["event"] == "done":
+                        # Update session before the client sees the end of the stream
+                        await asyncio.to_thread(session_manager.increment_message_count, request.session_id)
+                        event = {**event, "session_id": request.session_id}
+                    yield format_sse(event)
+        except SessionConflictError:
+            yield format_sse({"event": "error", "detail": "Session was updated by another request; retry"})
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {str(e)}")
+            yield format_sse({"event": "error", "detail": "Failed to generate response"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/sessions/{session_id}/history", response_model=ConversationHistory)
 async def get_session_history(session_id: str):
-    history = session_manager.get_session_history(session_id)
+    history = await asyncio.to_thread(session_manager.get_session_history, session_id)
     if history is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    metadata = session_manager.session_metadata[session_id]
+    metadata = await asyncio.to_thread(session_manager.get_session_metadata, session_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Session not found")
     return ConversationHistory(
         session_id=session_id,
         messages=history,
@@ -108,7 +178,7 @@ async def get_session_history(session_id: str):
 
 @app.post("/api/sessions/{session_id}/summary", response_model=SummaryResponse)
 async def get_session_summary(session_id: str, request: SummaryRequest):
-    therapist = session_manager.get_session(session_id)
+    therapist = await asyncio.to_thread(session_manager.get_session, session_id)
     if not therapist:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -123,15 +193,25 @@ async def get_session_summary(session_id: str, request: SummaryRequest):
         raise HTTPException(status_code=500, detail="Failed to generate summary")
 
 # RAG system endpoints
-@app.post("/api/rag/initialize")
+@app.post("/api/rag/initialize", status_code=202)
 async def initialize_rag():
     try:
-        await rag_system.load_and_index_datasets()
-        return {"status": "success", "message": "RAG system initialized"}
+        # Indexing runs in the background; progress is polled via /api/rag/jobs/{job_id}
+        job = indexing_jobs.start(
+            lambda job: rag_system.load_and_index_datasets(progress=job.update)
+        )
+        return {"status": job.status, "job_id": job.id, "message": "RAG indexing job started"}
     except Exception as e:
         logger.error(f"Error initializing RAG system: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to initialize RAG system")
 
+@app.get("/api/rag/jobs/{job_id}", response_model=IndexingJobStatus)
+async def get_indexing_job(job_id: str):
+    job = indexing_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 @app.get("/api/rag/stats", response_model=RAGStats)
 async def get_rag_stats():
     try:
@@ -156,6 +236,10 @@ async def startup_event():
     
     logger.info("API configuration verified")
 
+    # Expire idle sessions in the background
+    session_manager.start_reaper()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down AI Therapist API")
+    await session_manager.stop_reaper()
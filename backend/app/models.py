@@ -13,6 +13,8 @@ class ChatResponse(BaseModel):
     session_id: str
     timestamp: datetime = Field(default_factory=datetime.now)
     sources_used: Optional[List[str]] = None
+    token_usage: Optional[Dict[str, int]] = None
+    cached: bool = False
 
 class SessionCreate(BaseModel):
     user_id: Optional[str] = None
@@ -39,4 +41,38 @@ class RAGStats(BaseModel):
     total_documents: int
     collection_name: str
     embedding_model: str
-    last_updated: Optional[datetime] = None
\ No newline at end of file
+    last_updated: Optional[datetime] = None
+    embedding_cache: Optional[Dict[str, Any]] = None
+    embedding_batching: Optional[Dict[str, Any]] = None
+    retrieval_cache: Optional[Dict[str, Any]] = None
+
+class SessionStats(BaseModel):
+    resident_sessions: int
+    resident_bytes: int = 0
+    tracked_sessions: int
+    expiry_heap_entries: int
+    expired_sessions: int = 0
+    reaper_runs: int = 0
+    last_reap_seconds: Optional[float] = None
+    last_reaped_at: Optional[datetime] = None
+    spilled_sessions: int = 0
+    restored_sessions: int = 0
+    average_restore_ms: float = 0.0
+    p95_restore_ms: float = 0.0
+
+class IndexingJobStatus(BaseModel):
+    job_id: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    elapsed_seconds: float = 0.0
+    documents_indexed: int = 0
+    documents_per_second: float = 0.0
+    records_processed: int = 0
+    records_total: int = 0
+    eta_seconds: Optional[float] = None
+    datasets_loading: int = 0
+    datasets_failed: int = 0
+    datasets: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    error: Optional[str] = None
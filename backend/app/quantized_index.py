@@ -0,0 +1,143 @@
+import json
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.logger import rag_logger
+from app.config import settings
+
+# Number of set bits for every byte value, for Hamming distance on packed bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class QuantizedVectorIndex:
+    """
+    Compact memory-mapped vector index with quantized pre-filtering
+
+    Vectors are stored unit-normalized in three memory-mapped NumPy files:
+    sign bits (1 bit/dim), int8 scalar-quantized values (1 byte/dim) and
+    float32 originals. A query scores every row by Hamming distance on the
+    bits, re-scores the best candidates with an int8 dot product, and
+    re-ranks the survivors with float32 cosine similarity. Only the bit and
+    int8 arrays are scanned; float rows are paged in for the final few.
+    """
+
+    def __init__(self, index_dir: str):
+        self.logger = rag_logger.getChild("QuantizedVectorIndex")
+        self.index_dir = index_dir
+        self.ids: List[str] = []
+        self.binary: Optional[np.ndarray] = None
+        self.int8: Optional[np.ndarray] = None
+        self.vectors: Optional[np.ndarray] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.binary is not None
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.index_dir, "ids.json"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(
+        self,
+        total: int,
+        dim: int,
+        batches: Iterable[Tuple[Sequence[str], np.ndarray]]
+    ) -> None:
+        """Write the index from (ids, embeddings) batches without holding it all in memory"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        paths = {name: os.path.join(self.index_dir, f"{name}.npy.tmp") for name in ("binary", "int8", "float32")}
+        binary = np.lib.format.open_memmap(paths["binary"], mode="w+", dtype=np.uint8, shape=(total, (dim + 7) // 8))
+        int8 = np.lib.format.open_memmap(paths["int8"], mode="w+", dtype=np.int8, shape=(total, dim))
+        vectors = np.lib.format.open_memmap(paths["float32"], mode="w+", dtype=np.float32, shape=(total, dim))
+
+        ids: List[str] = []
+        for batch_ids, embeddings in batches:
+            embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+            start, end = len(ids), len(ids) + len(batch_ids)
+            if end > total:
+                raise ValueError(f"Index build received more than {total} vectors")
+            binary[start:end] = np.packbits(embeddings > 0, axis=1)
+            int8[start:end] = np.clip(np.round(embeddings * 127), -127, 127).astype(np.int8)
+            vectors[start:end] = embeddings
+            ids.extend(batch_ids)
+
+        for array in (binary, int8, vectors):
+            array.flush()
+        del binary, int8, vectors
+
+        # Swap the finished files in only once the build is complete
+        for name, path in paths.items():
+            array = np.load(path, mmap_mode="r")
+            if len(array) != len(ids):
+                # Fewer vectors than announced: keep just the written rows
+                np.save(path[:-len(".npy.tmp")] + ".npy", np.asarray(array[:len(ids)]))
+                os.remove(path)
+            else:
+                os.replace(path, path[:-len(".tmp")])
+        with open(os.path.join(self.index_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+
+        self.logger.info(f"Built quantized index with {len(ids)} vectors in {self.index_dir}")
+        self.load()
+
+    def load(self) -> None:
+        """Memory-map the index files"""
+        with open(os.path.join(self.index_dir, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.binary = np.load(os.path.join(self.index_dir, "binary.npy"), mmap_mode="r")
+        self.int8 = np.load(os.path.join(self.index_dir, "int8.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(self.index_dir, "float32.npy"), mmap_mode="r")
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        binary_candidates: int = None,
+        rerank_candidates: int = None
+    ) -> List[Tuple[str, float]]:
+        """Return the k nearest (id, cosine distance) pairs for a query vector"""
+        if not self.loaded or not self.ids:
+            return []
+        binary_candidates = max(k, binary_candidates or settings.QUANTIZED_BINARY_CANDIDATES)
+        rerank_candidates = max(k, rerank_candidates or settings.QUANTIZED_RERANK_CANDIDATES)
+        query = _normalize(np.asarray(query, dtype=np.float32))
+
+        # Stage 1: Hamming distance on sign bits over every row
+        hamming = self._hamming(np.packbits(query > 0))
+        candidates = self._top(-hamming.astype(np.int64), binary_candidates)
+
+        # Stage 2: int8 dot product on the survivors. float32 accumulation is
+        # exact here (|sum| < 2**24) and uses BLAS, unlike integer matmul.
+        query_int8 = np.clip(np.round(query * 127), -127, 127).astype(np.float32)
+        candidates = np.sort(candidates)
+        int8_scores = self.int8[candidates].astype(np.float32) @ query_int8
+        candidates = candidates[self._top(int8_scores, rerank_candidates)]
+
+        # Stage 3: exact cosine similarity on float vectors
+        candidates = np.sort(candidates)
+        similarities = self.vectors[candidates] @ query
+        best = self._top(similarities, k)
+        best = best[np.argsort(-similarities[best])]
+        return [(self.ids[candidates[i]], float(1.0 - similarities[i])) for i in best]
+
+    def _hamming(self, query_bits: np.ndarray) -> np.ndarray:
+        """Hamming distance from the query bits to every row"""
+        if hasattr(np, "bitwise_count") and self.binary.shape[1] % 8 == 0:
+            # Popcount over 64-bit words (NumPy 2.0+)
+            rows = self.binary.view(np.uint64)
+            return np.bitwise_count(rows ^ query_bits.view(np.uint64)).sum(axis=1, dtype=np.uint32)
+        return _POPCOUNT[np.bitwise_xor(self.binary, query_bits)].sum(axis=1, dtype=np.uint32)
+
+    @staticmethod
+    def _top(scores: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n highest scores, unordered"""
+        if n >= len(scores):
+            return np.arange(len(scores))
+        return np.argpartition(-scores, n - 1)[:n]
@@ -1,15 +1,33 @@
+import asyncio
+import itertools
 import os
-from typing import List, Dict, Any, Optional
+import re
+import time
+from typing import List, Dict, Any, Callable, Iterator, Optional
 from datetime import datetime
 
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+import numpy as np
 from datasets import load_dataset
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 
 from app.utils.logger import rag_logger
+from app.utils.near_dedup import MinHashDeduplicator
 from app.config import settings
+from app.document_store import DocumentStore
+from app.embedding_cache import QueryEmbeddingCache, normalize_query
+from app.embedding_service import BatchingEmbedder
+from app.ingestion import IngestionPipeline
+from app.lexical_index import BM25Index
+from app.quantized_index import QuantizedVectorIndex
+from app.reranking import mmr_select
+from app.retrieval_cache import RetrievalResultCache, quantize_embedding
+from app.vector_store import create_vector_store
+
+# Speaker labels that mark the start of a conversation turn
+TURN_LABEL_PATTERN = re.compile(
+    r"^(?:user|client|patient|human|seeker|counse(?:l)?lor|therapist|assistant|helper|supporter)\s*:",
+    re.IGNORECASE
+)
 
 class TherapyDatasetProcessor:
     """Handles processing and standardization of various therapy datasets"""
@@ -28,35 +46,162 @@ class TherapyDatasetProcessor:
         "AhmedSSoliman/sentiment-analysis-for-mental-health-Combined-Data": {"text_column": "text"}
     }
 
-    def __init__(self):
+    def __init__(self, near_dedup: bool = None):
         self.logger = rag_logger.getChild("DatasetProcessor")
 
+        if near_dedup is None:
+            near_dedup = settings.NEAR_DEDUP_ENABLED
+        self.near_deduplicator = MinHashDeduplicator(
+            threshold=settings.NEAR_DEDUP_THRESHOLD
+        ) if near_dedup else None
+
     def load_dataset(self, dataset_name: str) -> List[Dict[str, Any]]:
         """Load and process a dataset from Hugging Face"""
+        processed_data = []
+        try:
+            for chunk in self.iter_dataset(dataset_name):
+                processed_data.extend(chunk)
+        except Exception:
+            return []
+        return processed_data
+
+    def iter_dataset(
+        self,
+        dataset_name: str,
+        chunk_size: int = None,
+        streaming: bool = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream processed records from a Hugging Face dataset in chunks
+
+        With streaming enabled, rows are read lazily from the hub, so peak
+        memory is bounded by one chunk regardless of dataset size. Only the
+        columns listed in RAG_METADATA_FIELDS are kept as metadata.
+        """
+        chunk_size = chunk_size or settings.BATCH_SIZE
+        if streaming is None:
+            streaming = settings.DATASET_STREAMING
+
+        processed_count = 0
+        metadata_fields = set(settings.RAG_METADATA_FIELDS)
         try:
             config = self.DATASET_CONFIGS[dataset_name]
-            dataset = load_dataset(dataset_name)
-            processed_data = []
+            dataset = load_dataset(dataset_name, streaming=streaming)
+            chunk = []
 
             for split in dataset.keys():
                 data = dataset[split]
                 for item in data:
                     processed_text = self._process_text(item[config["text_column"]])
                     if processed_text:
-                        processed_data.append({
+                        metadata = {
+                            "source": dataset_name,
+                            "split": split,
+                            **{k: v for k, v in item.items() if k != config["text_column"]}
+                        }
+                        chunk.append({
                             "text": processed_text,
-                            "metadata": {
-                                "source": dataset_name,
-                                "split": split,
-                                **{k: v for k, v in item.items() if k != config["text_column"]}
-                            }
+                            "metadata": {k: v for k, v in metadata.items() if k in metadata_fields}
                         })
+                        if len(chunk) >= chunk_size:
+                            processed_count += len(chunk)
+                            yield chunk
+                            chunk = []
+
+            if chunk:
+                processed_count += len(chunk)
+                yield chunk
 
-            self.logger.info(f"Processed {len(processed_data)} entries from {dataset_name}")
-            return processed_data
+            self.logger.info(f"Processed {processed_count} entries from {dataset_name}")
         except Exception as e:
+            # Re-raise so a dropped stream fails the ingest instead of
+            # indexing a truncated dataset
             self.logger.error(f"Error processing dataset {dataset_name}: {str(e)}")
-            return []
+            raise
+
+    def filter_near_duplicates(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drop records that nearly duplicate one already seen by this processor
+
+        State accumulates across calls, so streaming chunks from several
+        datasets through one processor keeps a single representative per
+        cluster of templated conversations.
+        """
+        if self.near_deduplicator is None:
+            return records
+        return [r for r in records if not self.near_deduplicator.is_duplicate(r["text"])]
+
+    def chunk_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split long records into overlapping chunks sized for the embedder"""
+        chunks = []
+        for record in records:
+            chunks.extend(self.chunk_document(record))
+        return chunks
+
+    def chunk_document(
+        self,
+        record: Dict[str, Any],
+        max_words: int = None,
+        overlap_words: int = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Split one record into chunks by conversation turn with overlap
+
+        Turns (detected from speaker labels) are packed into windows of at
+        most max_words words; a turn longer than that is split on its own.
+        Consecutive chunks share trailing turns of up to overlap_words words.
+        Each chunk's metadata links it to its parent record and records its
+        word span, so neighbouring chunks can be stitched back together at
+        retrieval time.
+        """
+        max_words = max_words or settings.CHUNK_MAX_WORDS
+        if overlap_words is None:
+            overlap_words = settings.CHUNK_OVERLAP_WORDS
+
+        words = record["text"].split()
+        parent_id = record["id"]
+        if len(words) <= max_words:
+            spans = [(0, len(words))]
+        else:
+            # Turn boundaries, with oversized turns split into max_words pieces
+            starts = sorted({0} | {i for i, w in enumerate(words) if TURN_LABEL_PATTERN.match(w)})
+            ranges = []
+            for start, end in zip(starts, starts[1:] + [len(words)]):
+                for piece in range(start, end, max_words):
+                    ranges.append((piece, min(piece + max_words, end)))
+
+            spans = []
+            i = 0
+            while i < len(ranges):
+                start = ranges[i][0]
+                j = i
+                while j < len(ranges) and ranges[j][1] - start <= max_words:
+                    j += 1
+                end = ranges[j - 1][1]
+                spans.append((start, end))
+                if j >= len(ranges):
+                    break
+                # Step back over trailing turns to overlap with the next chunk
+                k = j
+                while k - 1 > i and end - ranges[k - 1][0] <= overlap_words:
+                    k -= 1
+                i = k
+
+        chunks = []
+        for index, (start, end) in enumerate(spans):
+            chunks.append({
+                "id": parent_id if len(spans) == 1 else f"{parent_id}:{index}",
+                "text": " ".join(words[start:end]),
+                "metadata": {
+                    **record["metadata"],
+                    "parent_id": parent_id,
+                    "chunk_index": index,
+                    "chunk_count": len(spans),
+                    "word_start": start,
+                    "word_end": end
+                }
+            })
+        return chunks
 
     def _process_text(self, text: str) -> Optional[str]:
         """Clean and standardize text data"""
@@ -80,100 +225,285 @@ class TherapyRAG:
         self.logger = rag_logger.getChild("TherapyRAG")
         self.vector_db_path = vector_db_path or settings.VECTOR_DB_PATH
         self.collection_name = "therapy_conversations"
-        
-        # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=self.vector_db_path,
-            settings=ChromaSettings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
+
+        # Vector backend selected by settings.VECTOR_BACKEND
+        self.vector_store = create_vector_store(self.vector_db_path, self.collection_name)
+        self.document_store = DocumentStore(os.path.join(self.vector_db_path, "documents.sqlite3"))
+        self.lexical_index = BM25Index(os.path.join(self.vector_db_path, "lexical_index.sqlite3"))
         
         # Initialize sentence transformer
         self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-        
-        # Get or create collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.embedder = BatchingEmbedder(self.embedding_model)
+        self.embedding_cache = QueryEmbeddingCache()
         
         self.dataset_processor = TherapyDatasetProcessor()
 
-    async def load_and_index_datasets(self) -> None:
-        """Load and index all configured datasets"""
+        # Optional compact index that replaces HNSW search
+        self.quantized_index = QuantizedVectorIndex(os.path.join(self.vector_db_path, "quantized_index"))
+        if settings.VECTOR_INDEX_MODE == "quantized" and self.quantized_index.exists():
+            self.quantized_index.load()
+
+        # Retrieval results are cached until the index version changes
+        self._index_generation = 0
+        self.result_cache = RetrievalResultCache() if settings.RETRIEVAL_CACHE_ENABLED else None
+
+    async def load_and_index_datasets(self, progress: Optional[Callable[..., None]] = None) -> None:
+        """Load and index all configured datasets, reporting per-dataset progress to ``progress``"""
         try:
-            total_documents = 0
-            
-            for dataset_name in tqdm(TherapyDatasetProcessor.DATASET_CONFIGS.keys()):
-                self.logger.info(f"Processing dataset: {dataset_name}")
-                
-                # Load and process dataset
-                documents = self.dataset_processor.load_dataset(dataset_name)
-                if not documents:
-                    continue
-                
-                # Process in batches
-                batch_size = settings.BATCH_SIZE
-                for i in range(0, len(documents), batch_size):
-                    batch = documents[i:i + batch_size]
-                    
-                    # Prepare batch data
-                    texts = [doc["text"] for doc in batch]
-                    ids = [f"{dataset_name}-{i+j}" for j in range(len(batch))]
-                    metadatas = [doc["metadata"] for doc in batch]
-                    
-                    # Generate embeddings
-                    embeddings = self.embedding_model.encode(texts)
-                    
-                    # Add to ChromaDB
-                    self.collection.add(
-                        documents=texts,
-                        embeddings=embeddings.tolist(),
-                        ids=ids,
-                        metadatas=metadatas
-                    )
-                    
-                    total_documents += len(batch)
-                    
+            pipeline = IngestionPipeline(
+                vector_store=self.vector_store,
+                document_store=self.document_store,
+                lexical_index=self.lexical_index,
+                embedding_model=self.embedding_model,
+                work_dir=self.vector_db_path,
+                progress=progress
+            )
+            # The pipeline blocks on worker processes and the model, so keep it off the event loop
+            total_documents = await asyncio.to_thread(pipeline.run)
             self.logger.info(f"Successfully indexed {total_documents} documents")
+
+            if settings.VECTOR_INDEX_MODE == "quantized":
+                await asyncio.to_thread(self.build_quantized_index)
+            self._index_generation += 1
             
         except Exception as e:
             self.logger.error(f"Error in load_and_index_datasets: {str(e)}")
             raise
 
+    async def embed_query(self, query: str):
+        """Embed a query, reusing cached embeddings for repeated queries"""
+        embedding = self.embedding_cache.get(query)
+        if embedding is None:
+            embedding = await self.embedder.encode(query)
+            self.embedding_cache.set(query, embedding)
+        return embedding
+
+    def index_version(self) -> tuple:
+        """Version of everything retrieval reads; changes whenever results may change"""
+        return (self.vector_store.version, self.lexical_index.version, self._index_generation)
+
     async def retrieve(self, query: str, n_results: int = None) -> List[Dict[str, Any]]:
-        """Retrieve similar documents for a query"""
+        """
+        Retrieve similar documents for a query
+
+        Results are cached per quantized query embedding and invalidated when
+        the index version changes. With HYBRID_RETRIEVAL on, BM25 search runs
+        in a worker thread alongside the dense search, and the two rankings
+        are merged with reciprocal rank fusion. With MMR_ENABLED, a pool of
+        MMR_CANDIDATE_MULTIPLIER x n_results candidates is reranked for
+        diversity.
+        """
         try:
             if n_results is None:
                 n_results = settings.RAG_N_RESULTS
-                
+
             # Generate query embedding
-            query_embedding = self.embedding_model.encode(query)
-            
-            # Query ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            query_embedding = await self.embed_query(query)
+
+            use_mmr = settings.MMR_ENABLED
+            use_hybrid = settings.HYBRID_RETRIEVAL and len(self.lexical_index) > 0
+            cache_key = None
+            if self.result_cache is not None:
+                start = time.perf_counter()
+                version = self.index_version()
+                cache_key = (
+                    quantize_embedding(query_embedding),
+                    n_results,
+                    # BM25 ranks depend on the query words, not just the embedding
+                    normalize_query(query) if use_hybrid else None,
+                    use_mmr,
+                    self.quantized_index.loaded
+                )
+                cached = self.result_cache.get(cache_key, version)
+                if cached is not None:
+                    return cached
+
+            pool_size = n_results * settings.MMR_CANDIDATE_MULTIPLIER if use_mmr else n_results
+            lexical_task = None
+            candidates = pool_size
+            if use_hybrid:
+                candidates = max(pool_size, settings.HYBRID_CANDIDATES)
+                lexical_task = asyncio.create_task(
+                    asyncio.to_thread(self.lexical_index.search, query, candidates)
+                )
             
-            # Format results
-            formatted_results = []
-            for i in range(len(results["documents"][0])):
-                formatted_results.append({
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i]
-                })
-                
-            return formatted_results
+            if self.quantized_index.loaded:
+                dense_results = await asyncio.to_thread(self._query_quantized, query_embedding, candidates)
+            else:
+                dense_results = await asyncio.to_thread(
+                    self._query_store, query_embedding, candidates, use_mmr
+                )
+
+            if lexical_task is not None:
+                formatted_results = self._fuse_rankings(dense_results, await lexical_task, pool_size)
+            else:
+                formatted_results = dense_results[:pool_size]
+
+            if use_mmr:
+                formatted_results = self._rerank_mmr(query_embedding, formatted_results, n_results)
+
+            results = self._attach_documents(formatted_results)
+            if cache_key is not None:
+                self.result_cache.set(cache_key, version, results, time.perf_counter() - start)
+            return results
             
         except Exception as e:
             self.logger.error(f"Error in retrieve: {str(e)}")
             return []
 
+    def _fuse_rankings(
+        self,
+        dense_results: List[Dict[str, Any]],
+        lexical_results: List[tuple],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """Merge dense results and BM25 (id, score) hits with reciprocal rank fusion"""
+        scores: Dict[str, float] = {}
+        for ranking in ([r["id"] for r in dense_results], [doc_id for doc_id, _ in lexical_results]):
+            for rank, doc_id in enumerate(ranking, 1):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (settings.RRF_K + rank)
+        top = sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+        # Lexical-only hits need their metadata from the vector store
+        by_id = {r["id"]: r for r in dense_results}
+        missing = [doc_id for doc_id in top if doc_id not in by_id]
+        if missing:
+            fetched = self.vector_store.get(ids=missing, include=["metadatas"])
+            for doc_id, metadata in zip(fetched["ids"], fetched["metadatas"]):
+                by_id[doc_id] = {"id": doc_id, "metadata": metadata, "distance": None}
+
+        return [{**by_id[doc_id], "score": scores[doc_id]} for doc_id in top if doc_id in by_id]
+
+    def _query_store(
+        self,
+        query_embedding,
+        n_results: int,
+        with_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Nearest neighbours from the configured vector store"""
+        include = ["metadatas", "distances"] + (["embeddings"] if with_embeddings else [])
+        results = self.vector_store.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=n_results,
+            include=include
+        )
+        formatted_results = [
+            {"id": doc_id, "metadata": metadata, "distance": distance}
+            for doc_id, metadata, distance in zip(
+                results["ids"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+        if with_embeddings:
+            for result, embedding in zip(formatted_results, results["embeddings"][0]):
+                result["embedding"] = embedding
+        return formatted_results
+
+    def _rerank_mmr(
+        self,
+        query_embedding,
+        candidates: List[Dict[str, Any]],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """Select a diverse subset of candidates by maximal marginal relevance"""
+        if len(candidates) <= 1:
+            return candidates[:n_results]
+
+        # Candidates from BM25 or the quantized index come without embeddings
+        missing = [c["id"] for c in candidates if c.get("embedding") is None]
+        fetched = {}
+        if missing:
+            page = self.vector_store.get(ids=missing, include=["embeddings"])
+            fetched = dict(zip(page["ids"], page["embeddings"]))
+        candidates = [c for c in candidates if c.get("embedding") is not None or c["id"] in fetched]
+
+        selected = mmr_select(
+            query_embedding,
+            [c["embedding"] if c.get("embedding") is not None else fetched[c["id"]] for c in candidates],
+            n_results,
+            lambda_mult=settings.MMR_LAMBDA,
+            sources=[c["metadata"].get("source") for c in candidates],
+            max_per_source=settings.MMR_MAX_PER_SOURCE
+        )
+        return [{k: v for k, v in candidates[i].items() if k != "embedding"} for i in selected]
+
+    def _query_quantized(self, query_embedding, n_results: int) -> List[Dict[str, Any]]:
+        """Nearest neighbours from the quantized index, with metadata fetched from the vector store by ID"""
+        matches = self.quantized_index.search(query_embedding, n_results)
+        if not matches:
+            return []
+
+        fetched = self.vector_store.get(ids=[doc_id for doc_id, _ in matches], include=["metadatas"])
+        metadatas = dict(zip(fetched["ids"], fetched["metadatas"]))
+        return [
+            {"id": doc_id, "metadata": metadatas[doc_id], "distance": distance}
+            for doc_id, distance in matches
+            if doc_id in metadatas
+        ]
+
+    def build_quantized_index(self) -> int:
+        """Export stored embeddings into the quantized index; returns the vector count"""
+        total = self.vector_store.count()
+        page_size = settings.BATCH_SIZE
+
+        def pages():
+            for offset in range(0, total, page_size):
+                page = self.vector_store.get(include=["embeddings"], limit=page_size, offset=offset)
+                yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32)
+
+        batches = pages()
+        first = next(batches, None)
+        if first is None:
+            self.logger.warning("Vector store is empty; quantized index not built")
+            return 0
+
+        self.quantized_index.build(total, first[1].shape[1], itertools.chain([first], batches))
+        self._index_generation += 1
+        return len(self.quantized_index)
+
+    def _attach_documents(
+        self,
+        results: List[Dict[str, Any]],
+        context_words: int = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fill in result texts from the document store
+
+        A chunk's text is its word span of the parent document, extended by
+        up to context_words words on each side for surrounding context.
+        Results indexed before the document store existed fall back to the
+        text stored in the vector store.
+        """
+        if context_words is None:
+            context_words = settings.RAG_CHUNK_CONTEXT_WORDS
+
+        parents = self.document_store.get_many([
+            result["metadata"].get("parent_id", result["id"]) for result in results
+        ])
+        missing = [
+            result["id"] for result in results
+            if result["metadata"].get("parent_id", result["id"]) not in parents
+        ]
+        inline = {}
+        if missing:
+            fetched = self.vector_store.get(ids=missing, include=["documents"])
+            inline = dict(zip(fetched["ids"], fetched["documents"]))
+
+        attached = []
+        for result in results:
+            metadata = result["metadata"]
+            parent = parents.get(metadata.get("parent_id", result["id"]))
+            if parent is None:
+                text = inline.get(result["id"])
+            elif metadata.get("chunk_count", 1) > 1:
+                words = parent.split()
+                start = max(0, metadata["word_start"] - context_words)
+                text = " ".join(words[start:metadata["word_end"] + context_words])
+            else:
+                text = parent
+            if text:
+                attached.append({**result, "text": text})
+        return attached
+
     async def get_context_for_llm(self, query: str, n_results: int = None) -> str:
         """Format retrieved context for LLM prompting"""
         results = await self.retrieve(query, n_results)
@@ -189,12 +519,15 @@ class TherapyRAG:
     def get_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
         try:
-            count = self.collection.count()
+            count = self.vector_store.count()
             return {
                 "total_documents": count,
                 "collection_name": self.collection_name,
                 "embedding_model": settings.EMBEDDING_MODEL,
-                "last_updated": datetime.now()
+                "last_updated": datetime.now(),
+                "embedding_cache": self.embedding_cache.get_stats(),
+                "embedding_batching": self.embedder.get_stats(),
+                "retrieval_cache": self.result_cache.get_stats() if self.result_cache is not None else None
             }
         except Exception as e:
             self.logger.error(f"Error in get_stats: {str(e)}")
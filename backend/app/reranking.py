@@ -0,0 +1,51 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+def mmr_select(
+    query_embedding: Sequence[float],
+    candidate_embeddings: Sequence[Sequence[float]],
+    n: int,
+    lambda_mult: float = 0.7,
+    sources: Optional[Sequence[str]] = None,
+    max_per_source: int = 0
+) -> List[int]:
+    """
+    Pick n candidate indices by maximal marginal relevance
+
+    Each step takes the candidate maximizing
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, selected),
+    using one cosine matrix computed up front. With max_per_source set,
+    candidates from a source that already has that many picks are skipped,
+    so fewer than n indices may come back.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if not len(candidates) or n <= 0:
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    per_source = {}
+
+    selected: List[int] = []
+    while len(selected) < n and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * np.maximum(redundancy, 0)
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        available[best] = False
+
+        if sources is not None and max_per_source:
+            source = sources[best]
+            if per_source.get(source, 0) >= max_per_source:
+                continue
+            per_source[source] = per_source.get(source, 0) + 1
+
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
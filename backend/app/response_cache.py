@@ -0,0 +1,116 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .utils.logger import therapist_logger
+from .config import settings
+
+class SemanticResponseCache:
+    """
+    Nearest-neighbour cache of replies to low-context messages
+
+    Message embeddings sit in a fixed-size matrix, one slot per entry, so a
+    lookup is one matrix-vector product. The closest entry is returned if
+    its cosine similarity clears the threshold. Entries expire after a TTL
+    and the least recently used one is evicted when the cache is full.
+    """
+
+    def __init__(
+        self,
+        max_size: int = None,
+        ttl_seconds: float = None,
+        threshold: float = None
+    ):
+        self.logger = therapist_logger.getChild("SemanticResponseCache")
+        self.max_size = max_size or settings.SEMANTIC_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds or settings.SEMANTIC_CACHE_TTL_SECONDS
+        self.threshold = threshold or settings.SEMANTIC_CACHE_THRESHOLD
+
+        self._lock = Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._active = np.zeros(self.max_size, dtype=bool)
+        # slot -> (message, response, expires_at), in LRU order
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, embedding: Any) -> Optional[Dict[str, Any]]:
+        """Return the cached reply closest to a message embedding, if similar enough"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors @ query
+            similarities[~self._active] = -np.inf
+            slot = int(np.argmax(similarities))
+            message, response, expires_at = self._entries[slot]
+            if expires_at <= now:
+                self._remove(slot)
+                self.misses += 1
+                return None
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return {"message": message, "response": response, "similarity": float(similarities[slot])}
+
+    def store(self, embedding: Any, message: str, response: str) -> None:
+        """Cache a reply under the message embedding"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+
+            if len(self._entries) >= self.max_size:
+                slot = next(iter(self._entries))
+                self._remove(slot)
+            else:
+                slot = int(np.argmin(self._active))
+
+            self._vectors[slot] = vector
+            self._active[slot] = True
+            self._entries[slot] = (message, response, time.monotonic() + self.ttl_seconds)
+
+    def _remove(self, slot: int) -> None:
+        del self._entries[slot]
+        self._active[slot] = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._active[:] = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
+
+_response_cache: Optional[SemanticResponseCache] = None
+_response_cache_lock = Lock()
+
+def get_response_cache() -> SemanticResponseCache:
+    """Return the process-wide semantic response cache"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SemanticResponseCache()
+        return _response_cache
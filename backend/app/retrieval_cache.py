@@ -0,0 +1,68 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.cache import TTLCache
+from app.config import settings
+
+def quantize_embedding(embedding: Any) -> bytes:
+    """Compact cache key for a query embedding: the unit vector rounded to int8"""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+    return np.round(vector * 127).astype(np.int8).tobytes()
+
+class RetrievalResultCache:
+    """
+    LRU/TTL cache of retrieval results tied to an index version
+
+    Keys combine the quantized query embedding with everything else that
+    shapes the result list. Every lookup passes the current index version;
+    when it differs from the version the entries were stored under, the
+    cache is cleared, so results never outlive a write to the index.
+    Latency of misses is tracked to estimate the time hits saved.
+    """
+
+    def __init__(self, max_size: int = None, ttl_seconds: int = None):
+        self.entries = TTLCache(
+            max_size=max_size or settings.RETRIEVAL_CACHE_SIZE,
+            ttl_seconds=ttl_seconds or settings.RETRIEVAL_CACHE_TTL_SECONDS
+        )
+        self.version: Optional[Hashable] = None
+        self.invalidations = 0
+        self._miss_seconds = 0.0
+        self._timed_misses = 0
+
+    def _check_version(self, version: Hashable) -> None:
+        if version != self.version:
+            if self.version is not None:
+                self.entries.clear()
+                self.invalidations += 1
+            self.version = version
+
+    def get(self, key: Tuple, version: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Cached results for a key under the given index version"""
+        self._check_version(version)
+        results = self.entries.get(key)
+        if results is None:
+            return None
+        return [dict(result) for result in results]
+
+    def set(self, key: Tuple, version: Hashable, results: List[Dict[str, Any]], elapsed: float) -> None:
+        """Store results computed in ``elapsed`` seconds under the given index version"""
+        self._check_version(version)
+        self.entries.set(key, [dict(result) for result in results])
+        self._miss_seconds += elapsed
+        self._timed_misses += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.entries.get_stats()
+        average_miss = self._miss_seconds / self._timed_misses if self._timed_misses else 0.0
+        stats.update({
+            "invalidations": self.invalidations,
+            "average_miss_latency_ms": average_miss * 1000,
+            "estimated_time_saved_ms": stats["hits"] * average_miss * 1000
+        })
+        return stats
@@ -1,20 +1,250 @@
+import asyncio
+import heapq
+import time
 import uuid
+import zlib
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any
-from threading import Lock
+from typing import Dict, Optional, List, Any, Tuple
+from threading import Event, Lock
 
 from .utils.logger import session_logger
 from .config import settings
 from .therapist import GeminiTherapist
+from .session_store import SessionConflictError, SessionStore, create_session_store, decode_state, encode_state
 
-class SessionManager:
-    """Manages therapy sessions and conversation state"""
+# Rough in-memory footprint of a therapist and of each history message
+# beyond its text, for the resident byte budget
+_THERAPIST_OVERHEAD_BYTES = 2048
+_MESSAGE_OVERHEAD_BYTES = 300
+
+def _resident_size(state: Dict[str, Any]) -> int:
+    """Estimate the memory a therapist holds from its exported state"""
+    return (
+        _THERAPIST_OVERHEAD_BYTES
+        + len(state.get("summary") or "")
+        + sum(len(content) + _MESSAGE_OVERHEAD_BYTES for _, content, _ in state.get("history", []))
+    )
+
+class _SessionShard:
+    """One lock stripe: the resident sessions whose IDs hash to it"""
 
     def __init__(self):
-        self.logger = session_logger.getChild("SessionManager")
+        self.lock = Lock()
         self.sessions: Dict[str, GeminiTherapist] = {}
-        self.session_metadata: Dict[str, Dict[str, Any]] = {}
-        self._lock = Lock()
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, int] = {}
+        self.turn_locks: Dict[str, asyncio.Lock] = {}
+        # TTL index: one heap entry per session; ``deadlines`` holds the
+        # current expiry, so activity never touches the heap
+        self.expiry_heap: List[Tuple[float, str]] = []
+        self.deadlines: Dict[str, float] = {}
+        # Resident sessions, least recently active first
+        self.lru: "OrderedDict[str, None]" = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.resident_bytes = 0
+        # This shard's share of SESSION_MAX_RESIDENT; 0 = unlimited
+        self.max_resident = 0
+        # Sessions dropped from memory whose spill save is still in flight;
+        # readers wait on the event rather than load the older stored copy
+        self.spilling: Dict[str, Event] = {}
+
+class SessionManager:
+    """
+    Manages therapy sessions and conversation state
+
+    The SessionStore is the source of truth; shards hold the therapists
+    resident in this process. A session missing locally, or whose stored
+    version moved on because another worker handled a turn, is rehydrated
+    from the store on first access, and every completed turn is saved back.
+    Saves are compare-and-set on the version this process last saw; when
+    another worker saved first, the local copy is dropped so the next
+    access reloads the stored one, and save_session raises
+    SessionConflictError.
+
+    Sessions are spread over SESSION_SHARDS stripes by a hash of the
+    session ID, each with its own lock, so requests for different sessions
+    rarely contend. Locks are only held for dictionary updates; therapist
+    construction and store I/O happen outside them. Methods that may touch
+    the store block, so async callers run them via asyncio.to_thread. Each
+    session also has an asyncio.Lock that callers hold around a chat turn,
+    so two concurrent messages in one session cannot interleave history
+    writes.
+
+    Idle sessions expire after ``ttl_seconds``. Each shard keeps a min-heap
+    of expiry deadlines that a background reaper pops, so a sweep costs
+    O(expired) rather than a scan of every session. Entries for sessions
+    that saw activity since they were pushed are re-pushed with their new
+    deadline when they surface, keeping the heap at one entry per session.
+
+    Residency can also be capped by SESSION_MAX_RESIDENT sessions and/or
+    SESSION_MAX_RESIDENT_BYTES. Each shard then keeps an LRU order and
+    spills its least recently active sessions, which are already in the
+    store, out of memory; the next get_session restores them. Caps are
+    split across shards with shares summing to the cap, so eviction order
+    is LRU per shard. A session cap below the shard count reduces the
+    number of shards to the cap, as every shard needs room for one. A
+    session whose turn is in progress, or whose running summary is still
+    being updated, is never spilled; callers must fetch
+    the therapist after taking its turn lock, since a session can be
+    spilled and restored as a new object while a request waits for it.
+    """
+
+    def __init__(
+        self,
+        num_shards: int = None,
+        rag_system: Any = None,
+        store: Optional[SessionStore] = None,
+        ttl_seconds: float = None,
+        max_resident: int = None,
+        max_resident_bytes: int = None
+    ):
+        self.logger = session_logger.getChild("SessionManager")
+        self.rag_system = rag_system
+        self.ttl_seconds = ttl_seconds or settings.SESSION_TIMEOUT_HOURS * 3600
+        num_shards = num_shards or settings.SESSION_SHARDS
+        max_resident = settings.SESSION_MAX_RESIDENT if max_resident is None else max_resident
+        max_resident_bytes = settings.SESSION_MAX_RESIDENT_BYTES if max_resident_bytes is None else max_resident_bytes
+        if max_resident:
+            num_shards = min(num_shards, max_resident)
+        self._shards = [_SessionShard() for _ in range(num_shards)]
+
+        if max_resident:
+            # The first shards take the remainder, so shares sum to the cap
+            share, remainder = divmod(max_resident, num_shards)
+            for i, shard in enumerate(self._shards):
+                shard.max_resident = share + (i < remainder)
+        self._shard_max_bytes = max_resident_bytes // len(self._shards) if max_resident_bytes else 0
+
+        # Spilled sessions must land on disk, which the in-memory store is not
+        if store is None and (max_resident or max_resident_bytes) and settings.SESSION_STORE_BACKEND == "memory":
+            store = create_session_store("sqlite")
+        self.store = store or create_session_store()
+
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._stats_lock = Lock()
+        self._stats = {
+            "expired_sessions": 0,
+            "reaper_runs": 0,
+            "last_reap_seconds": None,
+            "last_reaped_at": None,
+            "spilled_sessions": 0,
+            "restored_sessions": 0
+        }
+        self._restore_latencies = deque(maxlen=1000)
+
+    def _shard(self, session_id: str) -> _SessionShard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def _new_therapist(self) -> GeminiTherapist:
+        # Therapists borrow shared Gemini models, so construction is cheap
+        return GeminiTherapist(
+            gemini_api_key=settings.GEMINI_API_KEY,
+            rag_system=self.rag_system
+        )
+
+    def _set_resident(
+        self,
+        shard: _SessionShard,
+        session_id: str,
+        therapist: GeminiTherapist,
+        metadata: Dict[str, Any],
+        version: int,
+        size: int
+    ) -> None:
+        """Make a session resident; the caller holds the shard lock"""
+        shard.sessions[session_id] = therapist
+        shard.metadata[session_id] = metadata
+        shard.versions[session_id] = version
+        shard.lru[session_id] = None
+        shard.resident_bytes += size - shard.sizes.get(session_id, 0)
+        shard.sizes[session_id] = size
+
+    def _drop_resident(self, shard: _SessionShard, session_id: str) -> None:
+        """Drop a session's in-memory copy; the caller holds the shard lock"""
+        shard.sessions.pop(session_id, None)
+        shard.metadata.pop(session_id, None)
+        shard.versions.pop(session_id, None)
+        shard.lru.pop(session_id, None)
+        shard.resident_bytes -= shard.sizes.pop(session_id, 0)
+
+    def _evict(self, shard: _SessionShard, session_id: str) -> None:
+        """Forget a session entirely; the caller holds the shard lock"""
+        self._drop_resident(shard, session_id)
+        shard.turn_locks.pop(session_id, None)
+        shard.deadlines.pop(session_id, None)
+
+    def _over_limit(self, shard: _SessionShard) -> bool:
+        return bool(
+            (shard.max_resident and len(shard.sessions) > shard.max_resident)
+            or (self._shard_max_bytes and shard.resident_bytes > self._shard_max_bytes)
+        )
+
+    def _select_spills(self, shard: _SessionShard, keep: str) -> List[Tuple[str, Dict[str, Any], Dict[str, Any], int]]:
+        """Drop least recently active sessions until the shard is within its caps
+
+        The caller holds the shard lock. Returns what must be written back
+        to the store, which happens outside the lock; until then the
+        sessions are marked as spilling.
+        """
+        spills = []
+        for session_id in list(shard.lru):
+            if not self._over_limit(shard):
+                break
+            lock = shard.turn_locks.get(session_id)
+            if session_id == keep or (lock is not None and lock.locked()):
+                continue
+            # Its summary would land on an orphaned copy; spill it once done
+            if shard.sessions[session_id].summary_pending():
+                continue
+            # Save again so activity since the last turn and finished
+            # background summaries are not lost
+            spills.append((
+                session_id,
+                dict(shard.metadata[session_id]),
+                shard.sessions[session_id].export_state(),
+                shard.versions[session_id]
+            ))
+            self._drop_resident(shard, session_id)
+            shard.spilling[session_id] = Event()
+        return spills
+
+    def _spill(self, spills: List[Tuple[str, Dict[str, Any], Dict[str, Any], int]]) -> None:
+        for session_id, metadata, state, version in spills:
+            try:
+                self.store.save(session_id, metadata, encode_state(state), version + 1, expected_version=version)
+            except SessionConflictError:
+                # Another worker saved or deleted it; the stored copy wins
+                self.logger.debug(f"Discarded stale copy of session {session_id} on spill")
+            except Exception as e:
+                # The store keeps the copy saved at the end of the last turn
+                self.logger.error(f"Error spilling session {session_id}: {str(e)}")
+            finally:
+                shard = self._shard(session_id)
+                with shard.lock:
+                    spilled = shard.spilling.pop(session_id)
+                spilled.set()
+        if spills:
+            with self._stats_lock:
+                self._stats["spilled_sessions"] += len(spills)
+            self.logger.debug(f"Spilled {len(spills)} sessions to the session store")
+
+    def _wait_for_spill(self, shard: _SessionShard, session_id: str) -> None:
+        """Block until an in-flight spill of a session has reached the store"""
+        while True:
+            with shard.lock:
+                spilling = shard.spilling.get(session_id)
+            if spilling is None:
+                return
+            spilling.wait()
+
+    def _touch(self, shard: _SessionShard, session_id: str, now: datetime) -> None:
+        """Record activity and move the expiry deadline; the caller holds the shard lock"""
+        shard.metadata[session_id]["last_activity"] = now
+        shard.lru.move_to_end(session_id)
+        if session_id not in shard.deadlines:
+            heapq.heappush(shard.expiry_heap, (now.timestamp() + self.ttl_seconds, session_id))
+        shard.deadlines[session_id] = now.timestamp() + self.ttl_seconds
 
     def create_session(
         self,
@@ -24,49 +254,161 @@ class SessionManager:
         """Create a new therapy session"""
         try:
             session_id = str(uuid.uuid4())
-            
-            with self._lock:
-                # Initialize therapist instance
-                self.sessions[session_id] = GeminiTherapist(
-                    gemini_api_key=settings.GEMINI_API_KEY
-                )
-                
-                # Store session metadata
-                self.session_metadata[session_id] = {
-                    "created_at": datetime.now(),
-                    "last_activity": datetime.now(),
-                    "message_count": 0,
-                    "user_id": user_id,
-                    **(metadata or {})
-                }
-                
+
+            # Initialize therapist instance outside the lock
+            therapist = self._new_therapist()
+            now = datetime.now()
+            session_metadata = {
+                "created_at": now,
+                "last_activity": now,
+                "message_count": 0,
+                "user_id": user_id,
+                **(metadata or {})
+            }
+            state = therapist.export_state()
+            self.store.save(session_id, session_metadata, encode_state(state), 1)
+
+            shard = self._shard(session_id)
+            with shard.lock:
+                self._set_resident(shard, session_id, therapist, session_metadata, 1, _resident_size(state))
+                self._touch(shard, session_id, now)
+                spills = self._select_spills(shard, keep=session_id)
+            self._spill(spills)
+
             self.logger.info(f"Created new session: {session_id}")
             return session_id
-            
+
         except Exception as e:
             self.logger.error(f"Error creating session: {str(e)}")
             raise
 
+    def _restore(self, session_id: str) -> Optional[GeminiTherapist]:
+        """Rehydrate a session from the store into this process"""
+        start = time.perf_counter()
+        stored = self.store.load(session_id)
+        if stored is None:
+            return None
+        metadata, blob, version = stored
+        state = decode_state(blob)
+        therapist = self._new_therapist()
+        therapist.load_state(state)
+
+        shard = self._shard(session_id)
+        with shard.lock:
+            spilling = shard.spilling.get(session_id)
+            if spilling is None:
+                # A concurrent restore may have won the race
+                if shard.versions.get(session_id, 0) >= version:
+                    return shard.sessions[session_id]
+                self._set_resident(shard, session_id, therapist, metadata, version, _resident_size(state))
+                self._touch(shard, session_id, metadata["last_activity"])
+                spills = self._select_spills(shard, keep=session_id)
+        if spilling is not None:
+            # Restored and spilled again since the load; the store is about
+            # to move past what was read
+            spilling.wait()
+            return self._restore(session_id)
+        self._spill(spills)
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["restored_sessions"] += 1
+            self._restore_latencies.append(elapsed)
+        self.logger.debug(f"Restored session {session_id} at version {version} in {elapsed * 1000:.1f}ms")
+        return therapist
+
     def get_session(self, session_id: str) -> Optional[GeminiTherapist]:
-        """Retrieve an existing session"""
-        with self._lock:
-            therapist = self.sessions.get(session_id)
-            if therapist:
-                # Update last activity
-                if session_id in self.session_metadata:
-                    self.session_metadata[session_id]["last_activity"] = datetime.now()
-            return therapist
+        """Retrieve an existing session, restoring it from the store if needed"""
+        shard = self._shard(session_id)
+        self._wait_for_spill(shard, session_id)
+        with shard.lock:
+            therapist = shard.sessions.get(session_id)
+            version = shard.versions.get(session_id)
+
+        if therapist is not None and not self.store.shared:
+            stored_version = version
+        else:
+            stored_version = self.store.get_version(session_id)
+        if stored_version is None:
+            # Deleted, expired elsewhere, or never existed; evicting also
+            # drops any turn lock a caller created for the ID
+            with shard.lock:
+                self._evict(shard, session_id)
+            return None
+        if therapist is None or stored_version != version:
+            therapist = self._restore(session_id)
+            if therapist is None:
+                with shard.lock:
+                    self._evict(shard, session_id)
+                return None
+
+        with shard.lock:
+            if session_id in shard.metadata:
+                self._touch(shard, session_id, datetime.now())
+        return therapist
+
+    def save_session(self, session_id: str) -> None:
+        """Write a resident session's current state to the store
+
+        Raises SessionConflictError if another worker saved the session
+        since this process loaded it.
+        """
+        shard = self._shard(session_id)
+        with shard.lock:
+            therapist = shard.sessions.get(session_id)
+            if therapist is None:
+                return
+            metadata = dict(shard.metadata[session_id])
+            version = shard.versions[session_id] = shard.versions[session_id] + 1
+            state = therapist.export_state()
+            size = _resident_size(state)
+            shard.resident_bytes += size - shard.sizes[session_id]
+            shard.sizes[session_id] = size
+            spills = self._select_spills(shard, keep=session_id)
+        try:
+            self.store.save(session_id, metadata, encode_state(state), version, expected_version=version - 1)
+        except SessionConflictError:
+            self.logger.warning(f"Session {session_id} was saved concurrently by another worker; reloading")
+            with shard.lock:
+                if shard.versions.get(session_id) == version:
+                    self._drop_resident(shard, session_id)
+            raise
+        finally:
+            self._spill(spills)
+
+    def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a session's metadata"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            metadata = shard.metadata.get(session_id)
+            if metadata is not None:
+                return dict(metadata)
+        self._wait_for_spill(shard, session_id)
+        return self.store.load_metadata(session_id)
+
+    def session_lock(self, session_id: str) -> asyncio.Lock:
+        """Per-session lock that serializes chat turns within one session
+
+        Callers check the session exists first; a lock taken for an unknown
+        ID is dropped when get_session finds nothing under it.
+        """
+        shard = self._shard(session_id)
+        with shard.lock:
+            lock = shard.turn_locks.get(session_id)
+            if lock is None:
+                lock = shard.turn_locks[session_id] = asyncio.Lock()
+            return lock
 
     def delete_session(self, session_id: str) -> bool:
         """Remove a session"""
-        with self._lock:
-            if session_id in self.sessions:
-                del self.sessions[session_id]
-                if session_id in self.session_metadata:
-                    del self.session_metadata[session_id]
-                self.logger.info(f"Deleted session: {session_id}")
-                return True
+        shard = self._shard(session_id)
+        with shard.lock:
+            resident = session_id in shard.sessions
+            self._evict(shard, session_id)
+        if not (self.store.delete(session_id) or resident):
             return False
+        self.logger.info(f"Deleted session: {session_id}")
+        return True
 
     def get_session_history(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
         """Get conversation history for a session"""
@@ -75,39 +417,153 @@ class SessionManager:
             return therapist.get_conversation_history()
         return None
 
+    def _all_metadata(self) -> Dict[str, Dict[str, Any]]:
+        """Stored metadata, overlaid with fresher copies of resident sessions"""
+        sessions = self.store.list_metadata()
+        for shard in self._shards:
+            with shard.lock:
+                sessions.update(
+                    (session_id, dict(metadata))
+                    for session_id, metadata in shard.metadata.items()
+                    if session_id in sessions
+                )
+        return sessions
+
     def get_all_sessions(self) -> List[Dict[str, Any]]:
         """List all active sessions with metadata"""
-        with self._lock:
-            return [
-                {
-                    "session_id": session_id,
-                    **self.session_metadata[session_id]
-                }
-                for session_id in self.sessions.keys()
-            ]
+        return [
+            {"session_id": session_id, **metadata}
+            for session_id, metadata in self._all_metadata().items()
+        ]
 
     def cleanup_old_sessions(self, max_age_hours: int = None) -> int:
         """Remove inactive sessions"""
         if max_age_hours is None:
             max_age_hours = settings.SESSION_TIMEOUT_HOURS
-            
+
         cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-        sessions_to_delete = []
-        
-        with self._lock:
-            for session_id, metadata in self.session_metadata.items():
-                if metadata["last_activity"] < cutoff_time:
-                    sessions_to_delete.append(session_id)
-                    
-            for session_id in sessions_to_delete:
-                self.delete_session(session_id)
-                
-        self.logger.info(f"Cleaned up {len(sessions_to_delete)} old sessions")
-        return len(sessions_to_delete)
+        removed = 0
+        for session_id, metadata in self._all_metadata().items():
+            if metadata["last_activity"] < cutoff_time:
+                shard = self._shard(session_id)
+                with shard.lock:
+                    self._evict(shard, session_id)
+                self.store.delete(session_id)
+                removed += 1
+
+        with self._stats_lock:
+            self._stats["expired_sessions"] += removed
+        self.logger.info(f"Cleaned up {removed} old sessions")
+        return removed
+
+    def reap_expired(self, now: float = None) -> int:
+        """Evict sessions whose expiry deadline has passed, in O(expired)"""
+        start = time.perf_counter()
+        now = now if now is not None else time.time()
+        expired = []
+        for shard in self._shards:
+            with shard.lock:
+                heap = shard.expiry_heap
+                while heap and heap[0][0] <= now:
+                    _, session_id = heapq.heappop(heap)
+                    deadline = shard.deadlines.get(session_id)
+                    if deadline is None:
+                        continue
+                    if deadline > now:
+                        # Active since this entry was pushed
+                        heapq.heappush(heap, (deadline, session_id))
+                        continue
+                    lock = shard.turn_locks.get(session_id)
+                    if lock is not None and lock.locked():
+                        heapq.heappush(heap, (now + self.ttl_seconds, session_id))
+                        shard.deadlines[session_id] = now + self.ttl_seconds
+                        continue
+                    self._evict(shard, session_id)
+                    expired.append(session_id)
+
+        # Another worker may have kept a session alive; only delete it from
+        # the store when the stored activity is stale too
+        cutoff = datetime.fromtimestamp(now - self.ttl_seconds)
+        for session_id in expired:
+            metadata = self.store.load_metadata(session_id)
+            if metadata is None or metadata["last_activity"] <= cutoff:
+                self.store.delete(session_id)
+
+        with self._stats_lock:
+            self._stats["expired_sessions"] += len(expired)
+            self._stats["reaper_runs"] += 1
+            self._stats["last_reap_seconds"] = time.perf_counter() - start
+            self._stats["last_reaped_at"] = datetime.now()
+        if expired:
+            self.logger.info(f"Expired {len(expired)} idle sessions")
+        return len(expired)
+
+    async def _run_reaper(self, interval: float) -> None:
+        # One full sweep catches stored sessions this process has never
+        # loaded, e.g. left over from before a restart; it is retried on the
+        # next tick until it succeeds
+        swept = False
+        while True:
+            try:
+                if not swept:
+                    await asyncio.to_thread(self.cleanup_old_sessions, self.ttl_seconds / 3600)
+                    swept = True
+                else:
+                    await asyncio.to_thread(self.reap_expired)
+            except Exception as e:
+                self.logger.error(f"Error reaping sessions: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def start_reaper(self, interval: float = None) -> asyncio.Task:
+        """Start the periodic expiry task on the running event loop"""
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(
+                self._run_reaper(interval or settings.SESSION_REAPER_INTERVAL_SECONDS)
+            )
+        return self._reaper_task
+
+    async def stop_reaper(self) -> None:
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Resident session counts, expiry and spill counters, restore latency"""
+        resident = resident_bytes = tracked = heap_entries = 0
+        for shard in self._shards:
+            with shard.lock:
+                resident += len(shard.sessions)
+                resident_bytes += shard.resident_bytes
+                tracked += len(shard.deadlines)
+                heap_entries += len(shard.expiry_heap)
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._restore_latencies)
+        return {
+            "resident_sessions": resident,
+            "resident_bytes": resident_bytes,
+            "tracked_sessions": tracked,
+            "expiry_heap_entries": heap_entries,
+            **stats,
+            "average_restore_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "p95_restore_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        }
 
     def increment_message_count(self, session_id: str) -> None:
-        """Increment message count for a session"""
-        with self._lock:
-            if session_id in self.session_metadata:
-                self.session_metadata[session_id]["message_count"] += 1
-                self.session_metadata[session_id]["last_activity"] = datetime.now()
\ No newline at end of file
+        """Increment message count for a session and persist the completed turn"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            metadata = shard.metadata.get(session_id)
+            if metadata is None:
+                return
+            metadata["message_count"] += 1
+            self._touch(shard, session_id, datetime.now())
+        self.save_session(session_id)
+
+    def __len__(self) -> int:
+        """Number of sessions resident in this process"""
+        return sum(len(shard.sessions) for shard in self._shards)
@@ -0,0 +1,316 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+
+# Metadata fields stored as datetimes
+_DATETIME_FIELDS = ("created_at", "last_activity")
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compact binary form of a therapist state: minified JSON, zlib-compressed"""
+    return zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+
+def decode_state(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+def encode_metadata(metadata: Dict[str, Any]) -> str:
+    return json.dumps(
+        {k: v.timestamp() if k in _DATETIME_FIELDS and isinstance(v, datetime) else v for k, v in metadata.items()},
+        separators=(",", ":"),
+        default=str
+    )
+
+def decode_metadata(data: str) -> Dict[str, Any]:
+    metadata = json.loads(data)
+    for field in _DATETIME_FIELDS:
+        if isinstance(metadata.get(field), (int, float)):
+            metadata[field] = datetime.fromtimestamp(metadata[field])
+    return metadata
+
+class SessionConflictError(Exception):
+    """A conditional save found the stored version changed or the session gone"""
+
+    def __init__(self, session_id: str, expected_version: int):
+        super().__init__(f"Session {session_id} is no longer at version {expected_version}")
+        self.session_id = session_id
+        self.expected_version = expected_version
+
+class SessionStore(ABC):
+    """
+    Persistent home of session state, shared by every worker process
+
+    Each session has small JSON metadata, kept separate so listings and
+    cleanup never decompress conversations, an encoded therapist state
+    blob, and a version number bumped on every save so workers can tell
+    when their in-memory copy is stale. Saves with an ``expected_version``
+    are compare-and-set: they only write if the stored version still
+    matches, so two workers cannot both write the next version.
+    """
+
+    # Whether other processes can write to the store; if not, a resident
+    # session can never be stale
+    shared: bool = True
+
+    @abstractmethod
+    def save(
+        self,
+        session_id: str,
+        metadata: Dict[str, Any],
+        state: bytes,
+        version: int,
+        expected_version: Optional[int] = None
+    ) -> None:
+        """Write a session's metadata and state
+
+        With ``expected_version``, raise SessionConflictError instead of
+        writing unless the session is stored at that version.
+        """
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], bytes, int]]:
+        """Return (metadata, state, version) for a session, if stored"""
+
+    @abstractmethod
+    def load_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a session's metadata without its state"""
+
+    @abstractmethod
+    def get_version(self, session_id: str) -> Optional[int]:
+        """Return the stored version of a session"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Remove a session; returns whether it existed"""
+
+    @abstractmethod
+    def list_metadata(self) -> Dict[str, Dict[str, Any]]:
+        """Metadata of every stored session, keyed by session ID"""
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store; sessions do not survive restarts or span workers"""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[str, bytes, int]] = {}
+
+    def save(
+        self,
+        session_id: str,
+        metadata: Dict[str, Any],
+        state: bytes,
+        version: int,
+        expected_version: Optional[int] = None
+    ) -> None:
+        with self._lock:
+            if expected_version is not None:
+                entry = self._sessions.get(session_id)
+                if entry is None or entry[2] != expected_version:
+                    raise SessionConflictError(session_id, expected_version)
+            self._sessions[session_id] = (encode_metadata(metadata), state, version)
+
+    def load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], bytes, int]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        return decode_metadata(entry[0]), entry[1], entry[2]
+
+    def load_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        return decode_metadata(entry[0]) if entry is not None else None
+
+    def get_version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        return entry[2] if entry is not None else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def list_metadata(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._sessions.items())
+        return {session_id: decode_metadata(entry[0]) for session_id, entry in entries}
+
+class SQLiteSessionStore(SessionStore):
+    """Single-node store in a SQLite file in WAL mode, shared by local worker processes"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, metadata TEXT NOT NULL, state BLOB NOT NULL, version INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def save(
+        self,
+        session_id: str,
+        metadata: Dict[str, Any],
+        state: bytes,
+        version: int,
+        expected_version: Optional[int] = None
+    ) -> None:
+        with self._lock:
+            if expected_version is None:
+                cursor = self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (id, metadata, state, version) VALUES (?, ?, ?, ?)",
+                    (session_id, encode_metadata(metadata), state, version)
+                )
+            else:
+                # Atomic across processes: the row only changes if no other
+                # worker saved since this one loaded it
+                cursor = self._db.execute(
+                    "UPDATE sessions SET metadata = ?, state = ?, version = ? WHERE id = ? AND version = ?",
+                    (encode_metadata(metadata), state, version, session_id, expected_version)
+                )
+            self._db.commit()
+        if cursor.rowcount == 0:
+            raise SessionConflictError(session_id, expected_version)
+
+    def load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], bytes, int]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT metadata, state, version FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return decode_metadata(row[0]), row[1], row[2]
+
+    def load_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT metadata FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return decode_metadata(row[0]) if row is not None else None
+
+    def get_version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+        return cursor.rowcount > 0
+
+    def list_metadata(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, metadata FROM sessions").fetchall()
+        return {session_id: decode_metadata(metadata) for session_id, metadata in rows}
+
+class RedisSessionStore(SessionStore):
+    """
+    Multi-node store on any Redis-protocol server
+
+    Each session is a hash (metadata, state, version) that expires after
+    the session timeout, and an index set tracks session IDs for listings.
+    """
+
+    def __init__(self, client: Any = None, url: str = None, prefix: str = "therapist:session:", ttl_seconds: int = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("The redis session store requires the 'redis' package") from e
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+        self.prefix = prefix
+        self.index_key = prefix + "index"
+        self.ttl_seconds = ttl_seconds or settings.SESSION_TIMEOUT_HOURS * 3600
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def save(
+        self,
+        session_id: str,
+        metadata: Dict[str, Any],
+        state: bytes,
+        version: int,
+        expected_version: Optional[int] = None
+    ) -> None:
+        from redis.exceptions import WatchError
+
+        key = self._key(session_id)
+        with self.client.pipeline() as pipe:
+            try:
+                if expected_version is not None:
+                    # The transaction aborts if another client writes the
+                    # hash between this check and EXEC
+                    pipe.watch(key)
+                    stored = pipe.hget(key, "version")
+                    if stored is None or int(stored) != expected_version:
+                        raise SessionConflictError(session_id, expected_version)
+                    pipe.multi()
+                pipe.hset(key, mapping={"metadata": encode_metadata(metadata), "state": state, "version": version})
+                pipe.expire(key, self.ttl_seconds)
+                pipe.sadd(self.index_key, session_id)
+                pipe.execute()
+            except WatchError as e:
+                raise SessionConflictError(session_id, expected_version) from e
+
+    def load(self, session_id: str) -> Optional[Tuple[Dict[str, Any], bytes, int]]:
+        metadata, state, version = self.client.hmget(self._key(session_id), "metadata", "state", "version")
+        if state is None:
+            return None
+        return decode_metadata(metadata), state, int(version)
+
+    def load_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        metadata = self.client.hget(self._key(session_id), "metadata")
+        return decode_metadata(metadata) if metadata is not None else None
+
+    def get_version(self, session_id: str) -> Optional[int]:
+        version = self.client.hget(self._key(session_id), "version")
+        return int(version) if version is not None else None
+
+    def delete(self, session_id: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.srem(self.index_key, session_id)
+        deleted, _ = pipe.execute()
+        return deleted > 0
+
+    def list_metadata(self) -> Dict[str, Dict[str, Any]]:
+        session_ids = [s.decode() if isinstance(s, bytes) else s for s in self.client.smembers(self.index_key)]
+        if not session_ids:
+            return {}
+        pipe = self.client.pipeline()
+        for session_id in session_ids:
+            pipe.hget(self._key(session_id), "metadata")
+        sessions = {}
+        expired = []
+        for session_id, metadata in zip(session_ids, pipe.execute()):
+            if metadata is None:
+                expired.append(session_id)
+            else:
+                sessions[session_id] = decode_metadata(metadata)
+        # Hashes that expired through their TTL leave stale index entries behind
+        if expired:
+            self.client.srem(self.index_key, *expired)
+        return sessions
+
+def create_session_store(backend: str = None) -> SessionStore:
+    """Create the session store selected by ``settings.SESSION_STORE_BACKEND``"""
+    backend = backend or settings.SESSION_STORE_BACKEND
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(settings.SESSION_STORE_PATH)
+    if backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Unknown session store backend: {backend}")
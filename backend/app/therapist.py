@@ -1,45 +1,17 @@
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Union
 from datetime import datetime
 
 from .utils.logger import therapist_logger
 from .config import settings
 from .rag_system import TherapyRAG
+from .gemini_pool import GeminiClientPool, get_client_pool
+from .context_window import ContextWindow, ContextWindowManager
+from .monitoring import metrics_collector
+from .response_cache import SemanticResponseCache, get_response_cache
+from .utils.safety_checker import SafetyChecker
 
-class GeminiTherapist:
-    """AI Therapist using Gemini API with RAG support"""
-
-    def __init__(
-        self,
-        gemini_api_key: str,
-        rag_system: Optional[TherapyRAG] = None,
-        model_name: str = None
-    ):
-        self.logger = therapist_logger.getChild("GeminiTherapist")
-        self.model_name = model_name or settings.GEMINI_MODEL
-        self.conversation_history: List[Dict[str, Any]] = []
-        self.rag_system = rag_system
-
-        # Initialize Gemini API
-        genai.configure(api_key=gemini_api_key)
-        
-        # Configure the model with generation settings
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.8,
-            "top_k": 40
-        }
-        self.model = genai.GenerativeModel(
-            model_name=self.model_name,
-            generation_config=generation_config
-        )
-        
-        # Start chat
-        self.chat_session = self.model.start_chat(history=[])
-
-    def _build_system_prompt(self, context: str = "") -> str:
-        """Build system prompt with RAG context"""
-        base_prompt = """You are a compassionate and empathetic AI therapist. Your goal is to provide supportive, non-judgmental responses while maintaining professional boundaries. Focus on:
+THERAPIST_SYSTEM_PROMPT = """You are a compassionate and empathetic AI therapist. Your goal is to provide supportive, non-judgmental responses while maintaining professional boundaries. Focus on:
 
             1. Active Listening & Validation
             2. Emotional Support & Understanding
@@ -58,32 +30,343 @@ class GeminiTherapist:
             * For serious mental health -> Recommend therapy
             * No medical diagnoses
             * No prescriptions or medical advice
+"""
 
+class GeminiTherapist:
+    """AI Therapist using Gemini API with RAG support"""
+
+    def __init__(
+        self,
+        gemini_api_key: str = None,
+        rag_system: Optional[TherapyRAG] = None,
+        model_name: str = None,
+        client_pool: Optional[GeminiClientPool] = None,
+        context_manager: Optional[ContextWindowManager] = None,
+        response_cache: Optional[SemanticResponseCache] = None
+    ):
+        self.logger = therapist_logger.getChild("GeminiTherapist")
+        self.model_name = model_name or settings.GEMINI_MODEL
+        self.conversation_history: List[Dict[str, Any]] = []
+        self.rag_system = rag_system
+
+        # Models are shared process-wide; a session only keeps its own chat history
+        self.client_pool = client_pool or get_client_pool(gemini_api_key)
+        self.chat_history: List[Any] = []
+        self.context_manager = context_manager or ContextWindowManager()
+
+        # Replies to opening messages are shared across sessions when enabled
+        if response_cache is None and settings.SEMANTIC_CACHE_ENABLED:
+            response_cache = get_response_cache()
+        self.response_cache = response_cache
+        self.safety_checker = SafetyChecker()
+
+        # Rolling summary of turns folded out of the prompt. Offsets are
+        # absolute message indices so they survive history trimming.
+        self.running_summary: Optional[str] = None
+        self._history_offset = 0
+        self._summarized_until = 0
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def _build_system_prompt(
+        self,
+        context: str = "",
+        turns: Optional[List[Dict[str, Any]]] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        """Build system prompt with RAG context"""
+        base_prompt = THERAPIST_SYSTEM_PROMPT + """
             Reference Examples:
         """
 
         if context:
             base_prompt += f"\n{context}"
         
-        if self.conversation_history:
-            base_prompt += f"\n\nConversation History:\n{self._format_conversation_history()}"
+        if summary:
+            base_prompt += f"\n\nSession Summary:\n{summary}"
+
+        if turns is None:
+            turns = self.conversation_history[-settings.MAX_CONVERSATION_HISTORY:]
+        if turns:
+            base_prompt += f"\n\nConversation History:\n{self._format_conversation_history(turns)}"
             
         base_prompt += "\n\nRespond as a compassionate therapist while following all guidelines above."
         
         return base_prompt
 
-    def _format_conversation_history(self) -> str:
+    def _build_contents(self, window: ContextWindow) -> List[Dict[str, Any]]:
+        """
+        Build a compact, stateless message list for generate_content
+
+        The turns kept by the context window are sent once each, with
+        consecutive messages from the same role merged. RAG examples are
+        attached to the current user turn only, so they never accumulate in
+        later requests.
+        """
+        contents: List[Dict[str, Any]] = []
+        if window.summary:
+            contents.append({
+                "role": "user",
+                "parts": [f"Summary of our earlier conversation:\n{window.summary}"]
+            })
+        for msg in window.turns:
+            role = "user" if msg["role"] == "user" else "model"
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append(msg["content"])
+            else:
+                contents.append({"role": role, "parts": [msg["content"]]})
+
+        current = f"User: {window.user_message}"
+        context = self._format_examples(window.examples)
+        if context:
+            current = f"Reference Examples:\n{context}\n\n{current}"
+        if contents and contents[-1]["role"] == "user":
+            contents[-1]["parts"].append(current)
+        else:
+            contents.append({"role": "user", "parts": [current]})
+
+        return contents
+
+    def _format_examples(self, examples: List[Dict[str, Any]]) -> str:
+        """Format retrieved RAG examples for the prompt"""
+        return "\n\n".join(
+            f"Example {i}:\n{example['text']}" for i, example in enumerate(examples, 1)
+        )
+
+    def _format_conversation_history(self, messages: Optional[List[Dict[str, Any]]] = None) -> str:
         """Format conversation history for context"""
-        if not self.conversation_history:
+        if messages is None:
+            messages = self.conversation_history[-settings.MAX_CONVERSATION_HISTORY:]
+        if not messages:
             return "No previous conversation."
             
         formatted = []
-        for msg in self.conversation_history[-settings.MAX_CONVERSATION_HISTORY:]:
+        for msg in messages:
             role = "User" if msg["role"] == "user" else "Therapist"
             formatted.append(f"{role}: {msg['content']}")
             
         return "\n".join(formatted)
 
+    def _api_error(self, e: Exception) -> Exception:
+        """Map a Gemini SDK error to a user-facing exception"""
+        self.logger.error(f"Error from Gemini API: {str(e)}")
+        # Handle common API errors
+        if "api key" in str(e).lower():
+            return Exception("Invalid or missing API key. Please check your configuration.")
+        elif "rate limit" in str(e).lower():
+            return Exception("API rate limit exceeded. Please try again later.")
+        else:
+            return Exception(f"Error from Gemini API: {str(e)}")
+
+    async def _send_message(self, request: Union[str, List[Dict[str, Any]]]):
+        """Send a prompt to Gemini without blocking the event loop"""
+        if settings.GEMINI_STATELESS_PROMPTS:
+            return await self._generate(request, system_instruction=THERAPIST_SYSTEM_PROMPT)
+
+        async with self.client_pool.acquire(self.model_name) as model:
+            chat_session = model.start_chat(history=self.chat_history)
+            try:
+                response = await chat_session.send_message_async(request)
+            except Exception as e:
+                raise self._api_error(e)
+            self.chat_history = chat_session.history
+            return response
+
+    async def _generate(
+        self,
+        contents: Union[str, List[Dict[str, Any]]],
+        system_instruction: Optional[str] = None
+    ):
+        """Run a single stateless generate_content call"""
+        async with self.client_pool.acquire(self.model_name, system_instruction) as model:
+            try:
+                return await model.generate_content_async(contents)
+            except Exception as e:
+                raise self._api_error(e)
+
+    async def _stream_message(self, request: Union[str, List[Dict[str, Any]]]) -> AsyncIterator[Any]:
+        """Send a prompt to Gemini and yield response chunks as they are generated"""
+        if settings.GEMINI_STATELESS_PROMPTS:
+            async with self.client_pool.acquire(self.model_name, THERAPIST_SYSTEM_PROMPT) as model:
+                try:
+                    response = await model.generate_content_async(request, stream=True)
+                    async for chunk in response:
+                        yield chunk
+                except Exception as e:
+                    raise self._api_error(e)
+            return
+
+        async with self.client_pool.acquire(self.model_name) as model:
+            chat_session = model.start_chat(history=self.chat_history)
+            try:
+                response = await chat_session.send_message_async(request, stream=True)
+                async for chunk in response:
+                    yield chunk
+            except Exception as e:
+                raise self._api_error(e)
+            self.chat_history = chat_session.history
+
+    def _chunk_text(self, chunk: Any) -> str:
+        """Return the text of a streamed chunk, or "" for chunks without text parts"""
+        try:
+            return chunk.text or ""
+        except ValueError:
+            return ""
+
+    def _token_usage(self, response: Any) -> Optional[Dict[str, int]]:
+        """Extract and record token counts for one Gemini response"""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return None
+
+        token_usage = {
+            "input_tokens": usage.prompt_token_count,
+            "output_tokens": usage.candidates_token_count
+        }
+        metrics_collector.add_token_metric(
+            endpoint="chat",
+            input_tokens=token_usage["input_tokens"],
+            output_tokens=token_usage["output_tokens"]
+        )
+        self.logger.debug(
+            f"Token usage: {token_usage['input_tokens']} in, {token_usage['output_tokens']} out "
+            f"({len(self.conversation_history)} messages in history)"
+        )
+        return token_usage
+
+    async def _prepare_message(
+        self,
+        user_message: str,
+        use_rag: bool,
+        n_examples: int
+    ) -> Tuple[Union[str, List[Dict[str, Any]]], List[str]]:
+        """Build the request for a user message and return it with the RAG sources used"""
+        # Get RAG examples if enabled
+        retrieved = []
+        if use_rag and self.rag_system:
+            retrieved = await self.rag_system.retrieve(user_message, n_examples)
+
+        # Fit history and examples into the token budget
+        window = self.context_manager.build(
+            system_prompt=THERAPIST_SYSTEM_PROMPT,
+            user_message=user_message,
+            history=self._unsummarized_history(),
+            examples=retrieved,
+            summary=self.running_summary
+        )
+        sources_used = [example['metadata']['source'] for example in window.examples]
+
+        if settings.GEMINI_STATELESS_PROMPTS:
+            request = self._build_contents(window)
+        else:
+            # Build the complete message with context and guidelines
+            system_prompt = self._build_system_prompt(
+                self._format_examples(window.examples), window.turns, window.summary
+            )
+            request = f"{system_prompt}\n\nUser: {user_message}"
+
+        # Add user message to history
+        self.conversation_history.append({
+            "role": "user",
+            "content": user_message,
+            "timestamp": datetime.now()
+        })
+
+        return request, sources_used
+
+    def _record_response(self, response_text: str) -> None:
+        """Append the assistant reply to history and trim it"""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": response_text,
+            "timestamp": datetime.now()
+        })
+
+        # Trim history if needed
+        excess = len(self.conversation_history) - settings.MAX_CONVERSATION_HISTORY * 2
+        if excess > 0:
+            self.conversation_history = self.conversation_history[excess:]
+            self._history_offset += excess
+
+        self._schedule_summary_update()
+
+    def summary_pending(self) -> bool:
+        """Whether a background summary update is still running"""
+        return self._summary_task is not None and not self._summary_task.done()
+
+    def _unsummarized_history(self) -> List[Dict[str, Any]]:
+        """Return the messages not yet folded into the running summary"""
+        start = max(0, self._summarized_until - self._history_offset)
+        return self.conversation_history[start:]
+
+    def _schedule_summary_update(self) -> None:
+        """Fold the oldest unsummarized turns into the running summary in the background"""
+        if not settings.ROLLING_SUMMARY_ENABLED:
+            return
+        if self._summary_task and not self._summary_task.done():
+            return
+
+        pending = self._unsummarized_history()
+        if len(pending) <= settings.SUMMARY_TRIGGER_MESSAGES:
+            return
+
+        to_fold = pending[:len(pending) - settings.SUMMARY_KEEP_RECENT]
+        until = self._history_offset + len(self.conversation_history) - settings.SUMMARY_KEEP_RECENT
+        self._summary_task = asyncio.create_task(self._update_running_summary(to_fold, until))
+
+    async def _update_running_summary(self, messages: List[Dict[str, Any]], until: int) -> None:
+        """Merge a block of turns into the running summary"""
+        try:
+            prompt = (
+                "You maintain a running summary of a therapy conversation. Update the summary "
+                "below with the new conversation turns, keeping it concise and highlighting:\n"
+                "1. Main topics discussed\n"
+                "2. User's key concerns\n"
+                "3. Your therapeutic approaches used\n"
+                "4. Any action items or recommendations given\n\n"
+                f"Current summary:\n{self.running_summary or 'None yet.'}\n\n"
+                f"New turns:\n{self._format_conversation_history(messages)}"
+            )
+            response = await self._generate(prompt)
+            self.running_summary = response.text.strip()
+            self._summarized_until = max(self._summarized_until, until)
+            self.logger.debug(f"Running summary now covers {self._summarized_until} messages")
+        except Exception as e:
+            self.logger.error(f"Error updating running summary: {str(e)}")
+
+    async def _cacheable_embedding(self, user_message: str) -> Optional[Any]:
+        """Embedding to key the response cache on, or None if the message must not use it"""
+        if self.response_cache is None or self.rag_system is None:
+            return None
+        if len(self.conversation_history) > settings.SEMANTIC_CACHE_MAX_PRIOR_MESSAGES:
+            return None
+        if len(user_message.split()) > settings.SEMANTIC_CACHE_MAX_WORDS:
+            return None
+        # Anything the safety checker flags always gets a fresh reply
+        if self.safety_checker.check_content(user_message)["is_crisis"]:
+            return None
+        try:
+            return await self.rag_system.embed_query(user_message)
+        except Exception as e:
+            self.logger.error(f"Error embedding message for response cache: {str(e)}")
+            return None
+
+    def _cached_reply(self, user_message: str, embedding: Optional[Any]) -> Optional[str]:
+        """Return a cached reply and record the exchange, if one matches"""
+        if embedding is None:
+            return None
+        hit = self.response_cache.lookup(embedding)
+        if hit is None:
+            return None
+
+        self.logger.debug(f"Semantic cache hit (similarity {hit['similarity']:.3f})")
+        self.conversation_history.append({
+            "role": "user",
+            "content": user_message,
+            "timestamp": datetime.now()
+        })
+        self._record_response(hit["response"])
+        return hit["response"]
+
     async def chat(
         self,
         user_message: str,
@@ -92,57 +375,32 @@ class GeminiTherapist:
     ) -> Dict[str, Any]:
         """Generate a response to user message"""
         try:
-            # Get RAG context if enabled
-            context = ""
-            sources_used = []
-            if use_rag and self.rag_system:
-                retrieved = await self.rag_system.retrieve(user_message, n_examples)
-                if retrieved:
-                    context_parts = []
-                    for i, result in enumerate(retrieved, 1):
-                        context_parts.append(f"Example {i}:\n{result['text']}")
-                        sources_used.append(result['metadata']['source'])
-                    context = "\n\n".join(context_parts)
+            cache_embedding = await self._cacheable_embedding(user_message)
+            cached = self._cached_reply(user_message, cache_embedding)
+            if cached is not None:
+                return {
+                    "response": cached,
+                    "sources_used": None,
+                    "token_usage": None,
+                    "cached": True,
+                    "timestamp": datetime.now()
+                }
 
-            # Build the complete message with context and guidelines
-            system_prompt = self._build_system_prompt(context)
-            complete_message = f"{system_prompt}\n\nUser: {user_message}"
-            
-            # Add user message to history
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now()
-            })
-
-            try:
-                # Generate response
-                response = self.chat_session.send_message(complete_message)
-            except Exception as e:
-                self.logger.error(f"Error from Gemini API: {str(e)}")
-                # Handle common API errors
-                if "API key" in str(e).lower():
-                    raise Exception("Invalid or missing API key. Please check your configuration.")
-                elif "rate limit" in str(e).lower():
-                    raise Exception("API rate limit exceeded. Please try again later.")
-                else:
-                    raise Exception(f"Error from Gemini API: {str(e)}")
-
-            # Add assistant response to history
-            assistant_message = {
-                "role": "assistant",
-                "content": response.text,
-                "timestamp": datetime.now()
-            }
-            self.conversation_history.append(assistant_message)
+            request, sources_used = await self._prepare_message(
+                user_message, use_rag, n_examples
+            )
 
-            # Trim history if needed
-            if len(self.conversation_history) > settings.MAX_CONVERSATION_HISTORY * 2:
-                self.conversation_history = self.conversation_history[-settings.MAX_CONVERSATION_HISTORY * 2:]
+            # Generate response
+            response = await self._send_message(request)
+            self._record_response(response.text)
+            if cache_embedding is not None:
+                self.response_cache.store(cache_embedding, user_message, response.text)
 
             return {
                 "response": response.text,
                 "sources_used": sources_used if sources_used else None,
+                "token_usage": self._token_usage(response),
+                "cached": False,
                 "timestamp": datetime.now()
             }
 
@@ -150,16 +408,76 @@ class GeminiTherapist:
             self.logger.error(f"Error in chat: {str(e)}")
             raise
 
+    async def chat_stream(
+        self,
+        user_message: str,
+        use_rag: bool = True,
+        n_examples: int = 3
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a response to user message as a stream of events
+
+        Yields a "sources" event first, then one "token" event per generated
+        chunk and a final "done" event once the full reply is in history.
+        """
+        try:
+            cache_embedding = await self._cacheable_embedding(user_message)
+            cached = self._cached_reply(user_message, cache_embedding)
+            if cached is not None:
+                yield {"event": "sources", "sources_used": None}
+                yield {"event": "token", "text": cached}
+                yield {"event": "done", "token_usage": None, "cached": True, "timestamp": datetime.now()}
+                return
+
+            request, sources_used = await self._prepare_message(
+                user_message, use_rag, n_examples
+            )
+            yield {"event": "sources", "sources_used": sources_used if sources_used else None}
+
+            chunks = []
+            last_chunk = None
+            async for chunk in self._stream_message(request):
+                last_chunk = chunk
+                text = self._chunk_text(chunk)
+                if text:
+                    chunks.append(text)
+                    yield {"event": "token", "text": text}
+
+            response_text = "".join(chunks)
+            self._record_response(response_text)
+            if cache_embedding is not None and response_text:
+                self.response_cache.store(cache_embedding, user_message, response_text)
+            yield {
+                "event": "done",
+                "token_usage": self._token_usage(last_chunk),
+                "cached": False,
+                "timestamp": datetime.now()
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error in chat_stream: {str(e)}")
+            raise
+
     def reset_conversation(self) -> None:
         """Clear conversation history"""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
         self.conversation_history = []
-        self.chat_session = self.model.start_chat(history=[])
+        self.chat_history = []
+        self.running_summary = None
+        self._history_offset = 0
+        self._summarized_until = 0
+        self._summary_task = None
 
     async def get_conversation_summary(self) -> str:
         """Generate a summary of the conversation"""
         if not self.conversation_history:
             return "No conversation to summarize."
 
+        # Long sessions already carry a running summary
+        if self.running_summary:
+            return self.running_summary
+
         try:
             summary_prompt = (
                 "Please provide a concise summary of the following therapy conversation, highlighting:\n"
@@ -170,7 +488,7 @@ class GeminiTherapist:
                 f"Conversation:\n{self._format_conversation_history()}"
             )
 
-            response =  self.chat_session.send_message(summary_prompt)
+            response = await self._generate(summary_prompt)
 
             return response.text
 
@@ -180,4 +498,27 @@ class GeminiTherapist:
 
     def get_conversation_history(self) -> List[Dict[str, Any]]:
         """Return the conversation history"""
-        return self.conversation_history
\ No newline at end of file
+        return self.conversation_history
+
+    def export_state(self) -> Dict[str, Any]:
+        """Serializable conversation state, for the session store"""
+        return {
+            "history": [
+                [message["role"], message["content"], message["timestamp"].timestamp()]
+                for message in self.conversation_history
+            ],
+            "summary": self.running_summary,
+            "history_offset": self._history_offset,
+            "summarized_until": self._summarized_until
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """Restore conversation state produced by export_state"""
+        self.reset_conversation()
+        self.conversation_history = [
+            {"role": role, "content": content, "timestamp": datetime.fromtimestamp(timestamp)}
+            for role, content, timestamp in state.get("history", [])
+        ]
+        self.running_summary = state.get("summary")
+        self._history_offset = state.get("history_offset", 0)
+        self._summarized_until = state.get("summarized_until", 0)
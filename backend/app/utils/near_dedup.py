@@ -0,0 +1,96 @@
+import zlib
+from typing import Dict
+
+import numpy as np
+
+# Mersenne prime modulus for the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+class MinHashDeduplicator:
+    """
+    Streaming near-duplicate detection with MinHash LSH over word shingles
+
+    Each text is reduced to a MinHash signature and split into bands; texts
+    sharing a band bucket with an earlier representative are compared by
+    estimated Jaccard similarity. The first text of each cluster is kept as
+    its representative, so only one signature per cluster stays in memory.
+
+    Representatives are stored compactly: signatures truncated to uint32 in
+    one growable matrix, and buckets keyed by an integer hash of each band.
+    Memory still grows with the number of unique texts, about 2 KB each
+    with the default 128 permutations and 16 bands.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 1
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self._count = 0
+        self._buckets: Dict[int, int] = {}
+        self.duplicates = 0
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        if len(words) <= self.shingle_size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {
+                " ".join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)
+            }
+        return np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a text's word shingles, truncated to 32 bits"""
+        shingles = self._shingles(text)
+        hashes = (np.outer(self._a, shingles) + self._b[:, None]) % _PRIME
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Return True if text nearly duplicates an earlier one; otherwise remember it"""
+        signature = self.signature(text)
+        # Colliding keys only cost an extra similarity check
+        band_keys = [
+            hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            for band in range(self.bands)
+        ]
+
+        checked = set()
+        for key in band_keys:
+            candidate = self._buckets.get(key)
+            if candidate is None or candidate in checked:
+                continue
+            checked.add(candidate)
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold:
+                self.duplicates += 1
+                return True
+
+        index = self._count
+        if index == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[index] = signature
+        self._count += 1
+        for key in band_keys:
+            self._buckets.setdefault(key, index)
+        return False
+
+    def __len__(self) -> int:
+        return self._count
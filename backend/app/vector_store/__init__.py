@@ -0,0 +1,21 @@
+import os
+
+from app.config import settings
+from app.vector_store.base import VectorStore
+from app.vector_store.chroma_store import ChromaVectorStore
+from app.vector_store.numpy_store import NumpyVectorStore
+
+__all__ = ["VectorStore", "ChromaVectorStore", "NumpyVectorStore", "create_vector_store"]
+
+def create_vector_store(path: str, collection_name: str, backend: str = None) -> VectorStore:
+    """Create the vector store selected by ``settings.VECTOR_BACKEND``"""
+    backend = backend or settings.VECTOR_BACKEND
+    if backend == "chroma":
+        return ChromaVectorStore(path, collection_name)
+    if backend == "numpy":
+        return NumpyVectorStore(
+            os.path.join(path, f"{collection_name}_numpy"),
+            use_faiss=settings.NUMPY_STORE_USE_FAISS,
+            nlist=settings.NUMPY_STORE_FAISS_NLIST
+        )
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+
+class VectorStore(ABC):
+    """
+    Minimal vector store interface used by the RAG system
+
+    Method signatures and result shapes follow Chroma's collection API, so
+    results are dicts of lists (nested per query for ``query``) and
+    distances are cosine distances (1 - cosine similarity). Documents are
+    optional; the RAG system keeps texts in a separate document store.
+    """
+
+    # Bumped on every write so cached query results can detect staleness
+    version: int = 0
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Add new records"""
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Insert records, replacing any with the same ID"""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """Nearest neighbours for each query embedding"""
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, List[Any]]:
+        """Fetch records by ID, or a page of all records"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored records"""
@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+
+from app.vector_store.base import VectorStore
+
+class ChromaVectorStore(VectorStore):
+    """Vector store backed by a persistent Chroma collection (HNSW, cosine)"""
+
+    def __init__(self, path: str, collection_name: str):
+        self.client = chromadb.PersistentClient(
+            path=path,
+            settings=ChromaSettings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        self.version += 1
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        self.version += 1
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        if include is None:
+            include = ["documents", "metadatas", "distances"]
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, include=include)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, List[Any]]:
+        if include is None:
+            include = ["documents", "metadatas"]
+        return self.collection.get(ids=ids, include=include, limit=limit, offset=offset)
+
+    def count(self) -> int:
+        return self.collection.count()
@@ -0,0 +1,253 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.utils.logger import rag_logger
+from app.vector_store.base import VectorStore
+
+try:
+    import faiss
+except ImportError:  # FAISS is optional; NumPy brute force is used without it
+    faiss = None
+
+# Rows reserved up front whenever the vector file has to grow
+_MIN_CAPACITY = 1024
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store held in a memory-mapped NumPy array
+
+    Unit-normalized float32 vectors live in a flat file mapped into memory,
+    so search is one matrix-vector product with no per-query IPC or
+    metadata joins. Documents and metadata sit in a SQLite sidecar keyed by
+    row number and are only read for the rows that are returned.
+
+    If ``faiss`` is installed, search goes through a FAISS inner-product
+    index instead (flat, or IVF when ``nlist`` is set), rebuilt lazily
+    after writes. The corpus is read-heavy and rarely updated, so the
+    rebuild cost is paid once per indexing run.
+    """
+
+    def __init__(self, path: str, use_faiss: bool = True, nlist: int = 0, nprobe: int = 8):
+        self.logger = rag_logger.getChild("NumpyVectorStore")
+        self.path = path
+        self.use_faiss = use_faiss and faiss is not None
+        self.nlist = nlist
+        self.nprobe = nprobe
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._db = sqlite3.connect(os.path.join(path, "records.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER)")
+        self._db.commit()
+
+        info = dict(self._db.execute("SELECT key, value FROM info").fetchall())
+        self.dim: Optional[int] = info.get("dim")
+        self._size = self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._faiss_index = None
+        if self.dim is not None and os.path.exists(self._vectors_path):
+            self._map(os.path.getsize(self._vectors_path) // (4 * self.dim))
+
+    def _map(self, capacity: int) -> None:
+        """(Re)map the vector file, growing it to ``capacity`` rows"""
+        required = capacity * self.dim * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < required:
+                f.truncate(required)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows > self._capacity:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._map(max(rows, self._capacity * 2, _MIN_CAPACITY))
+
+    def _write(self, ids: List[str], embeddings, documents: Optional[List[str]], metadatas: List[Dict[str, Any]], replace: bool) -> None:
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._db.execute("INSERT OR REPLACE INTO info VALUES ('dim', ?)", (self.dim,))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            existing = dict(self._lookup(ids))
+            if existing and not replace:
+                raise ValueError(f"IDs already exist: {sorted(existing)[:5]}")
+
+            rows = []
+            for doc_id in ids:
+                if doc_id not in existing:
+                    existing[doc_id] = self._size
+                    self._size += 1
+                rows.append(existing[doc_id])
+
+            self._ensure_capacity(self._size)
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (row, doc_id, document, json.dumps(metadata))
+                    for row, doc_id, document, metadata in zip(rows, ids, documents or [None] * len(ids), metadatas)
+                ]
+            )
+            self._db.commit()
+            self._faiss_index = None
+            self.version += 1
+
+    def _lookup(self, ids: List[str]) -> List[tuple]:
+        """(id, row) pairs for the IDs that exist"""
+        pairs = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            pairs.extend(self._db.execute(
+                f"SELECT id, row FROM records WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+        return pairs
+
+    def _records(self, rows: List[int]) -> Dict[int, tuple]:
+        """row -> (id, document, metadata) for the given rows"""
+        records = {}
+        for start in range(0, len(rows), 500):
+            chunk = [int(row) for row in rows[start:start + 500]]
+            placeholders = ",".join("?" * len(chunk))
+            for row, doc_id, document, metadata in self._db.execute(
+                f"SELECT row, id, document, metadata FROM records WHERE row IN ({placeholders})", chunk
+            ):
+                records[row] = (doc_id, document, json.loads(metadata))
+        return records
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self._write(ids, embeddings, documents, metadatas, replace=False)
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[List[str]],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        self._write(ids, embeddings, documents, metadatas, replace=True)
+
+    def _build_faiss(self):
+        vectors = np.ascontiguousarray(self._vectors[:self._size])
+        if self.nlist and self._size >= self.nlist * 39:
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, self.nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.nprobe = self.nprobe
+        else:
+            index = faiss.IndexFlatIP(self.dim)
+        index.add(vectors)
+        return index
+
+    def _search(self, queries: np.ndarray, k: int):
+        """Top-k (rows, similarities) per query"""
+        if self.use_faiss:
+            if self._faiss_index is None:
+                self._faiss_index = self._build_faiss()
+            similarities, rows = self._faiss_index.search(queries, k)
+            return rows, similarities
+
+        scores = queries @ self._vectors[:self._size].T
+        if k < self._size:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(self._size), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        if include is None:
+            include = ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        results: Dict[str, List[List[Any]]] = {"ids": []}
+        for field in include:
+            results[field] = []
+
+        with self._lock:
+            k = min(n_results, self._size)
+            if k == 0:
+                for field in results:
+                    results[field] = [[] for _ in queries]
+                return results
+
+            all_rows, all_similarities = self._search(queries, k)
+            records = self._records(sorted({int(row) for row in all_rows.ravel() if row >= 0}))
+            for rows, similarities in zip(all_rows, all_similarities):
+                hits = [(int(row), float(sim)) for row, sim in zip(rows, similarities) if row >= 0]
+                results["ids"].append([records[row][0] for row, _ in hits])
+                if "documents" in include:
+                    results["documents"].append([records[row][1] for row, _ in hits])
+                if "metadatas" in include:
+                    results["metadatas"].append([records[row][2] for row, _ in hits])
+                if "distances" in include:
+                    results["distances"].append([1.0 - sim for _, sim in hits])
+                if "embeddings" in include:
+                    results["embeddings"].append([self._vectors[row].tolist() for row, _ in hits])
+        return results
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, List[Any]]:
+        if include is None:
+            include = ["documents", "metadatas"]
+
+        with self._lock:
+            if ids is not None:
+                rows = [row for _, row in self._lookup(ids)]
+            else:
+                start = offset or 0
+                stop = self._size if limit is None else min(self._size, start + limit)
+                rows = list(range(start, stop))
+            records = self._records(rows)
+            rows = [row for row in rows if row in records]
+
+            results: Dict[str, List[Any]] = {"ids": [records[row][0] for row in rows]}
+            if "documents" in include:
+                results["documents"] = [records[row][1] for row in rows]
+            if "metadatas" in include:
+                results["metadatas"] = [records[row][2] for row in rows]
+            if "embeddings" in include:
+                results["embeddings"] = [self._vectors[row].tolist() for row in rows]
+        return results
+
+    def count(self) -> int:
+        return self._size
@@ -0,0 +1,80 @@
+"""
+Benchmark query embedding throughput: per-query encode vs micro-batching
+
+Simulates N concurrent sessions each calling retrieve() with a fresh query.
+The per-query path encodes each query on its own, as TherapyRAG did before
+BatchingEmbedder; the batched path sends them through BatchingEmbedder.
+
+Usage (from backend/):
+    python -m benchmarks.bench_embedding_batching --queries 512 --concurrency 64
+"""
+import argparse
+import asyncio
+import time
+
+from sentence_transformers import SentenceTransformer
+
+from app.config import settings
+from app.embedding_service import BatchingEmbedder
+
+SAMPLE_QUERIES = [
+    "I feel anxious about work",
+    "I can't sleep at night",
+    "My partner and I keep arguing",
+    "I had a panic attack at the grocery store",
+    "I feel lonely since moving to a new city",
+    "How do I stop overthinking everything",
+    "I'm grieving my father",
+    "I have no motivation to get out of bed",
+]
+
+def make_queries(n: int):
+    # Unique suffixes so nothing is served from a cache
+    return [f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} ({i})" for i in range(n)]
+
+async def run_per_query(model, queries, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            model.encode(query)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return time.perf_counter() - start
+
+async def run_batched(embedder, queries, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            await embedder.encode(query)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return time.perf_counter() - start
+
+async def main(args):
+    model = SentenceTransformer(args.model)
+    model.encode(["warm up"])
+    queries = make_queries(args.queries)
+
+    per_query = await run_per_query(model, queries, args.concurrency)
+    embedder = BatchingEmbedder(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    batched = await run_batched(embedder, queries, args.concurrency)
+
+    print(f"queries={args.queries} concurrency={args.concurrency} "
+          f"max_batch_size={embedder.max_batch_size} max_wait_ms={args.max_wait_ms}")
+    print(f"per-query: {per_query:.2f}s  {args.queries / per_query:,.0f} queries/s")
+    print(f"batched:   {batched:.2f}s  {args.queries / batched:,.0f} queries/s  "
+          f"(avg batch {embedder.get_stats()['average_batch_size']:.1f})")
+    print(f"speedup:   {per_query / batched:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=settings.EMBEDDING_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=settings.EMBEDDING_BATCH_MAX_WAIT_MS)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+"""
+Benchmark peak memory of dataset processing: materialized vs streaming
+
+Each mode runs in a fresh subprocess and reports its peak RSS, so the
+measurements do not contaminate each other. "materialized" collects every
+processed record into a list, as load_dataset did before streaming;
+"streaming" consumes iter_dataset chunk by chunk, as the ingest pipeline
+does; "streaming+dedup" also runs each chunk through the near-duplicate
+filter (NEAR_DEDUP_ENABLED), whose state grows with the unique records.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest_memory --dataset ShenLab/MentalChat16K
+    python -m benchmarks.bench_ingest_memory --synthetic-rows 200000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+def synthetic_load_dataset(rows: int):
+    """Stand-in for datasets.load_dataset that generates rows lazily"""
+    from datasets import IterableDataset
+
+    def generate():
+        for i in range(rows):
+            yield {
+                "conversation": f"User: I have been feeling anxious about work lately ({i}). " * 20,
+                "topic": "anxiety",
+                "turns": 12
+            }
+
+    def load(name, streaming=False):
+        dataset = IterableDataset.from_generator(generate)
+        return {"train": dataset if streaming else list(dataset)}
+    return load
+
+def run_mode(args) -> None:
+    from app import rag_system
+    from app.rag_system import TherapyDatasetProcessor
+
+    dataset_name = args.dataset
+    if args.synthetic_rows:
+        rag_system.load_dataset = synthetic_load_dataset(args.synthetic_rows)
+        dataset_name = "ShenLab/MentalChat16K"
+
+    processor = TherapyDatasetProcessor(near_dedup=args.mode == "streaming+dedup")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.mode == "materialized":
+        records = []
+        for chunk in processor.iter_dataset(dataset_name, streaming=False):
+            records.extend(chunk)
+        count = len(records)
+    else:
+        count = 0
+        for chunk in processor.iter_dataset(dataset_name, streaming=True):
+            count += len(processor.filter_near_duplicates(chunk))
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": args.mode, "records": count, "baseline_kb": baseline, "peak_kb": peak}))
+
+def main(args) -> None:
+    results = []
+    for mode in ("materialized", "streaming", "streaming+dedup"):
+        cmd = [sys.executable, "-m", "benchmarks.bench_ingest_memory", "--mode", mode, "--dataset", args.dataset]
+        if args.synthetic_rows:
+            cmd += ["--synthetic-rows", str(args.synthetic_rows)]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for result in results:
+        growth_mb = (result["peak_kb"] - result["baseline_kb"]) / 1024
+        print(f"{result['mode']:>15}: {result['records']:,} records, "
+              f"peak RSS {result['peak_kb'] / 1024:,.0f} MB (+{growth_mb:,.0f} MB while processing)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default="ShenLab/MentalChat16K")
+    parser.add_argument("--synthetic-rows", type=int, default=0)
+    parser.add_argument("--mode", choices=["materialized", "streaming", "streaming+dedup"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    run_mode(args) if args.mode else main(args)
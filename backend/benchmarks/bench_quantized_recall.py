@@ -0,0 +1,101 @@
+"""
+Benchmark the quantized index against the Chroma HNSW collection
+
+Reports recall@k against exact float32 cosine search, query latency and the
+size of the arrays each query scans. Queries are stored vectors with
+Gaussian noise, so each has a well-defined neighbourhood.
+
+Usage (from backend/):
+    python -m benchmarks.bench_quantized_recall --vector-db ./therapy_vector_db
+    python -m benchmarks.bench_quantized_recall --synthetic 50000
+"""
+import argparse
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+
+from app.quantized_index import QuantizedVectorIndex
+
+def synthetic_collection(n: int, dim: int, seed: int = 0):
+    """Clustered unit vectors loaded into an in-memory HNSW collection"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 250), dim))
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.normal(size=(n, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+    client = chromadb.EphemeralClient(settings=ChromaSettings(anonymized_telemetry=False))
+    collection = client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+    ids = [f"doc-{i}" for i in range(n)]
+    for start in range(0, n, 5000):
+        collection.add(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000].tolist())
+    return collection, ids, vectors
+
+def load_collection(path: str):
+    client = chromadb.PersistentClient(path=path, settings=ChromaSettings(anonymized_telemetry=False))
+    collection = client.get_collection("therapy_conversations")
+    ids, vectors = [], []
+    total = collection.count()
+    for offset in range(0, total, 5000):
+        page = collection.get(include=["embeddings"], limit=5000, offset=offset)
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    vectors = np.concatenate(vectors)
+    return collection, ids, vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall(found, expected) -> float:
+    return len(set(found) & set(expected)) / len(expected)
+
+def main(args):
+    if args.synthetic:
+        collection, ids, vectors = synthetic_collection(args.synthetic, args.dim)
+    else:
+        collection, ids, vectors = load_collection(args.vector_db)
+
+    index = QuantizedVectorIndex(tempfile.mkdtemp(prefix="quantized_index_"))
+    index.build(len(ids), vectors.shape[1], (
+        (ids[i:i + 5000], vectors[i:i + 5000]) for i in range(0, len(ids), 5000)
+    ))
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = queries + args.noise * rng.normal(size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    hnsw_recall, quantized_recall, hnsw_times, quantized_times = [], [], [], []
+    for query in queries:
+        exact = [ids[i] for i in np.argsort(-(vectors @ query))[:args.k]]
+
+        start = time.perf_counter()
+        hnsw = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=[])["ids"][0]
+        hnsw_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        quantized = [doc_id for doc_id, _ in index.search(query, args.k)]
+        quantized_times.append(time.perf_counter() - start)
+
+        hnsw_recall.append(recall(hnsw, exact))
+        quantized_recall.append(recall(quantized, exact))
+
+    float_bytes = vectors.nbytes
+    scanned_bytes = index.binary.nbytes
+    print(f"vectors={len(ids):,} dim={vectors.shape[1]} queries={args.queries} k={args.k}")
+    print(f"hnsw:      recall@{args.k}={np.mean(hnsw_recall):.3f}  "
+          f"p50={np.median(hnsw_times) * 1000:.2f}ms  p95={np.percentile(hnsw_times, 95) * 1000:.2f}ms")
+    print(f"quantized: recall@{args.k}={np.mean(quantized_recall):.3f}  "
+          f"p50={np.median(quantized_times) * 1000:.2f}ms  p95={np.percentile(quantized_times, 95) * 1000:.2f}ms")
+    print(f"full scan per query: {scanned_bytes / 2**20:,.1f} MB of sign bits vs "
+          f"{float_bytes / 2**20:,.1f} MB float32 ({float_bytes / scanned_bytes:.0f}x smaller); "
+          f"int8 and float32 rows are read for candidates only")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db", default="./therapy_vector_db")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of a vector DB")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    main(parser.parse_args())
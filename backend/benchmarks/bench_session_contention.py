@@ -0,0 +1,77 @@
+"""
+Benchmark SessionManager lock contention: one lock vs lock striping
+
+Worker threads hammer a shared SessionManager with a request-like mix of
+get_session, increment_message_count and create_session calls on random
+sessions. A manager with one shard behaves like the old single-lock
+design. Reports throughput and per-call latency percentiles.
+
+Usage (from backend/):
+    python -m benchmarks.bench_session_contention --threads 16 --ops 20000
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+
+from app.session_manager import SessionManager
+from app.utils.logger import session_logger
+
+def run(num_shards: int, threads: int, ops: int, sessions: int, seed: int = 0):
+    manager = SessionManager(num_shards=num_shards)
+    session_ids = [manager.create_session() for _ in range(sessions)]
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index: int):
+        rng = random.Random(seed + index)
+        timings = latencies[index]
+        barrier.wait()
+        for _ in range(ops // threads):
+            session_id = rng.choice(session_ids)
+            roll = rng.random()
+            start = time.perf_counter()
+            if roll < 0.80:
+                manager.get_session(session_id)
+            elif roll < 0.98:
+                manager.increment_message_count(session_id)
+            else:
+                manager.create_session()
+            timings.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.asarray(t) for t in latencies]) * 1e6
+    return {
+        "ops_per_second": len(all_latencies) / elapsed,
+        "p50_us": float(np.percentile(all_latencies, 50)),
+        "p99_us": float(np.percentile(all_latencies, 99)),
+        "max_us": float(all_latencies.max())
+    }
+
+def main(args):
+    # Per-session INFO logs would dominate the timings
+    session_logger.setLevel(logging.WARNING)
+    print(f"threads={args.threads} ops={args.ops} sessions={args.sessions}")
+    for shards in (1, args.shards):
+        result = run(shards, args.threads, args.ops, args.sessions)
+        print(f"shards={shards:<3d} {result['ops_per_second']:,.0f} ops/s  "
+              f"p50={result['p50_us']:.1f}us  p99={result['p99_us']:.1f}us  max={result['max_us']:.0f}us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=32)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""
+Compare the Chroma and NumPy vector store backends
+
+Both stores are filled with the same vectors, documents and metadata, then
+queried through the VectorStore interface with documents and metadata
+included, as the RAG system does. Reports recall@k against exact cosine
+search, query latency and build time. Queries are stored vectors with
+Gaussian noise, so each has a well-defined neighbourhood.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_backends --synthetic 50000
+    python -m benchmarks.bench_vector_backends --vector-db ./therapy_vector_db
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app.vector_store import ChromaVectorStore, NumpyVectorStore
+
+def synthetic_corpus(n: int, dim: int, seed: int = 0):
+    """Clustered unit vectors with short placeholder documents"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 250), dim))
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.normal(size=(n, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(n)]
+    documents = [f"synthetic document {i}" for i in range(n)]
+    metadatas = [{"source": "synthetic", "row": i} for i in range(n)]
+    return ids, vectors, documents, metadatas
+
+def load_corpus(path: str):
+    store = ChromaVectorStore(path, "therapy_conversations")
+    ids, vectors, documents, metadatas = [], [], [], []
+    for offset in range(0, store.count(), 5000):
+        page = store.get(include=["embeddings", "documents", "metadatas"], limit=5000, offset=offset)
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+    vectors = np.concatenate(vectors)
+    return ids, vectors / np.linalg.norm(vectors, axis=1, keepdims=True), documents, metadatas
+
+def fill(store, ids, vectors, documents, metadatas) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(ids), 5000):
+        store.add(ids[i:i + 5000], vectors[i:i + 5000].tolist(), documents[i:i + 5000], metadatas[i:i + 5000])
+    return time.perf_counter() - start
+
+def recall(found, expected) -> float:
+    return len(set(found) & set(expected)) / len(expected)
+
+def main(args):
+    if args.synthetic:
+        corpus = synthetic_corpus(args.synthetic, args.dim)
+    else:
+        corpus = load_corpus(args.vector_db)
+    ids, vectors = corpus[0], corpus[1]
+
+    stores = {
+        "chroma": ChromaVectorStore(tempfile.mkdtemp(prefix="bench_chroma_"), "bench"),
+        "numpy": NumpyVectorStore(tempfile.mkdtemp(prefix="bench_numpy_"), use_faiss=False),
+    }
+    if args.faiss:
+        stores["numpy+faiss"] = NumpyVectorStore(tempfile.mkdtemp(prefix="bench_faiss_"), nlist=args.nlist)
+    build_times = {name: fill(store, *corpus) for name, store in stores.items()}
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = queries + args.noise * rng.normal(size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    exact = [[ids[i] for i in np.argsort(-(vectors @ query))[:args.k]] for query in queries]
+
+    print(f"vectors={len(ids):,} dim={vectors.shape[1]} queries={args.queries} k={args.k}")
+    for name, store in stores.items():
+        # Warm-up query so lazy index builds are not timed
+        store.query([queries[0].tolist()], n_results=args.k)
+        times, recalls = [], []
+        for query, expected in zip(queries, exact):
+            start = time.perf_counter()
+            found = store.query(
+                [query.tolist()], n_results=args.k, include=["documents", "metadatas", "distances"]
+            )["ids"][0]
+            times.append(time.perf_counter() - start)
+            recalls.append(recall(found, expected))
+        print(f"{name:12s} recall@{args.k}={np.mean(recalls):.3f}  "
+              f"p50={np.median(times) * 1000:.2f}ms  p95={np.percentile(times, 95) * 1000:.2f}ms  "
+              f"build={build_times[name]:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db", default="./therapy_vector_db")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of a vector DB")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--faiss", action="store_true", help="also benchmark the FAISS-backed NumPy store")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists for the FAISS store (0 = flat)")
+    main(parser.parse_args())
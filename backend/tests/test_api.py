@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from ..app.main import app
+from ..app.main import app, session_manager
 from ..app.models import (
     ChatRequest,
     SessionCreate,
@@ -50,6 +50,8 @@ def test_chat_with_invalid_session(test_client):
     )
     response = test_client.post("/api/chat", json=request.dict())
     assert response.status_code == 404
+    # Rejected before a turn lock was created for the made-up ID
+    assert "nonexistent_session" not in session_manager._shard("nonexistent_session").turn_locks
 
 def test_chat_flow(test_client):
     # Create session
@@ -92,6 +94,10 @@ def test_rag_stats(test_client):
     assert "collection_name" in data
     assert "embedding_model" in data
 
+def test_unknown_indexing_job(test_client):
+    response = test_client.get("/api/rag/jobs/does-not-exist")
+    assert response.status_code == 404
+
 def test_cors_headers(test_client):
     response = test_client.options("/api/health")
     assert "access-control-allow-origin" in response.headers
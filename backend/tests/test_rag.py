@@ -1,6 +1,23 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from ..app import rag_system
 from ..app.rag_system import TherapyDatasetProcessor, TherapyRAG
+from ..app.embedding_cache import QueryEmbeddingCache
+from ..app.embedding_service import BatchingEmbedder
+from ..app.quantized_index import QuantizedVectorIndex
+from ..app import ingestion
+from ..app.ingestion import IngestionPipeline, _spool_path, content_id
+from ..app.jobs import IndexingJobManager
+from ..app.vector_store import NumpyVectorStore
+from ..app.document_store import DocumentStore
+from ..app.lexical_index import BM25Index
+from ..app.reranking import mmr_select
+from ..app.retrieval_cache import RetrievalResultCache
 
 @pytest.fixture
 def mock_sentence_transformer():
@@ -70,4 +87,324 @@ async def test_get_context_for_llm(mock_sentence_transformer, mock_chromadb):
         ]
         context = rag.get_context_for_llm("test query")
         assert isinstance(context, str)
-        assert "Example conversation" in context
\ No newline at end of file
+        assert "Example conversation" in context
+
+def test_query_embedding_cache_normalizes_queries():
+    cache = QueryEmbeddingCache(max_size=10, ttl_seconds=60, disk_path="")
+    assert cache.get("I feel anxious") is None
+    cache.set("I feel anxious", [0.1, 0.2, 0.3])
+    assert cache.get("  i FEEL   anxious ") is not None
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_query_embedding_cache_persists_to_disk(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    QueryEmbeddingCache(ttl_seconds=60, disk_path=path).set("thank you", [0.5, 0.5])
+    restored = QueryEmbeddingCache(ttl_seconds=60, disk_path=path)
+    assert list(restored.get("Thank you")) == [0.5, 0.5]
+    assert restored.get_stats()["disk_hits"] == 1
+
+@pytest.mark.asyncio
+async def test_batching_embedder_coalesces_concurrent_queries():
+    model = Mock()
+    model.encode.side_effect = lambda texts: np.array([[float(len(t))] for t in texts])
+    embedder = BatchingEmbedder(model, max_batch_size=16, max_wait_ms=5)
+
+    queries = ["a" * n for n in range(1, 11)]
+    results = await asyncio.gather(*(embedder.encode(q) for q in queries))
+
+    assert [r[0] for r in results] == [float(len(q)) for q in queries]
+    assert model.encode.call_count == 1
+
+def test_iter_dataset_streams_in_chunks():
+    processor = TherapyDatasetProcessor()
+    rows = [{"text": f"I have been feeling low lately ({i})", "label": i} for i in range(5)]
+    with patch.object(rag_system, "load_dataset", return_value={"train": rows}) as mock_load:
+        chunks = list(processor.iter_dataset("dair-ai/emotion", chunk_size=2))
+    mock_load.assert_called_once_with("dair-ai/emotion", streaming=True)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert chunks[0][0]["metadata"] == {"source": "dair-ai/emotion", "split": "train"}
+
+def test_iter_dataset_keeps_whitelisted_columns():
+    processor = TherapyDatasetProcessor()
+    rows = [{"text": "I have been feeling low lately", "label": 3, "raw": {"nested": True}}]
+    with patch.object(rag_system, "load_dataset", return_value={"train": rows}), \
+            patch.object(rag_system.settings, "RAG_METADATA_FIELDS", ["source", "label"]):
+        chunks = list(processor.iter_dataset("dair-ai/emotion"))
+    assert chunks[0][0]["metadata"] == {"source": "dair-ai/emotion", "label": 3}
+
+def test_iter_dataset_raises_when_the_stream_drops():
+    def rows():
+        yield {"text": "I have been feeling low lately", "label": 0}
+        raise ConnectionError("stream dropped")
+
+    processor = TherapyDatasetProcessor()
+    with patch.object(rag_system, "load_dataset", side_effect=lambda *a, **k: {"train": rows()}):
+        with pytest.raises(ConnectionError):
+            list(processor.iter_dataset("dair-ai/emotion", chunk_size=1))
+        assert processor.load_dataset("dair-ai/emotion") == []
+
+def test_near_duplicate_filter_keeps_one_representative():
+    processor = TherapyDatasetProcessor(near_dedup=True)
+    template = ("Client: I have been feeling really anxious about my job and I cannot sleep at night. "
+                "Counselor: That sounds exhausting, can you tell me more about what keeps you up {}")
+    records = [{"text": template.format(name)} for name in ["Sam?", "Alex?", "Jo?"]]
+    records.append({"text": "Client: My sister and I stopped talking after the funeral and I miss her."})
+    kept = processor.filter_near_duplicates(records)
+    assert [r["text"] for r in kept] == [records[0]["text"], records[3]["text"]]
+
+def test_chunk_document_splits_by_turn_with_overlap():
+    processor = TherapyDatasetProcessor()
+    turns = [f"{'Client' if i % 2 == 0 else 'Counselor'}: " + " ".join(["word"] * 9) for i in range(6)]
+    record = {"id": "parent", "text": " ".join(turns), "metadata": {"source": "test"}}
+
+    chunks = processor.chunk_document(record, max_words=30, overlap_words=10)
+    spans = [(c["metadata"]["word_start"], c["metadata"]["word_end"]) for c in chunks]
+    assert spans == [(0, 30), (20, 50), (40, 60)]
+    assert [c["id"] for c in chunks] == ["parent:0", "parent:1", "parent:2"]
+    assert all(c["text"].startswith(("Client:", "Counselor:")) for c in chunks)
+    assert {c["metadata"]["chunk_count"] for c in chunks} == {3}
+
+def test_retrieve_attaches_documents_with_bounded_context(tmp_path):
+    processor = TherapyDatasetProcessor()
+    record = {"id": "p", "text": " ".join(f"w{i}" for i in range(60)), "metadata": {"source": "test"}}
+    chunks = {c["id"]: c for c in processor.chunk_document(record, max_words=20, overlap_words=0)}
+
+    rag = TherapyRAG.__new__(TherapyRAG)
+    rag.document_store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    rag.document_store.put_many([("p", record["text"])])
+    rag.vector_store = Mock()
+    rag.vector_store.get.return_value = {"ids": ["legacy"], "documents": ["inline text"]}
+    results = [
+        {"id": "p:1", "metadata": chunks["p:1"]["metadata"], "distance": 0.1},
+        {"id": "legacy", "metadata": {"source": "old"}, "distance": 0.2}
+    ]
+    attached = rag._attach_documents(results, context_words=3)
+    assert attached[0]["text"].split() == [f"w{i}" for i in range(17, 43)]
+    assert attached[1]["text"] == "inline text"
+    rag.vector_store.get.assert_called_once_with(ids=["legacy"], include=["documents"])
+
+def test_bm25_index_ranks_keyword_matches(tmp_path):
+    index = BM25Index(str(tmp_path / "lexical.sqlite3"))
+    docs = [
+        ("generic", "I hear you, that sounds really hard and I am here for you"),
+        ("panic", "I had a panic attack at work during a meeting"),
+        ("sleep", "My insomnia is getting worse and I cannot sleep"),
+        ("work", "Work has been stressful lately"),
+    ]
+    assert index.add(docs) == 4
+    assert index.add(docs[:2]) == 0
+
+    reloaded = BM25Index(str(tmp_path / "lexical.sqlite3"))
+    assert [doc_id for doc_id, _ in reloaded.search("panic attack at work", 2)] == ["panic", "work"]
+    assert [doc_id for doc_id, _ in reloaded.search("insomnia", 5)] == ["sleep"]
+    assert reloaded.search("the and of", 5) == []
+
+def test_bm25_index_skips_common_terms(tmp_path):
+    index = BM25Index(str(tmp_path / "lexical.sqlite3"), max_df_ratio=0.5)
+    index.add([(f"filler{i}", f"feeling anxious today number {i}") for i in range(6)])
+    index.add([("rare", "feeling anxious about my panic")])
+
+    results = index.search("feeling panic", 10)
+    assert [doc_id for doc_id, _ in results] == ["rare"]
+    # With only common terms, the rarest one still ranks documents
+    assert len(index.search("feeling anxious", 10)) == 7
+
+    # Indexes from before document frequencies were stored are backfilled
+    index._db.execute("DELETE FROM terms")
+    index._db.commit()
+    reloaded = BM25Index(str(tmp_path / "lexical.sqlite3"), max_df_ratio=0.5)
+    assert reloaded.search("feeling panic", 10) == results
+
+def test_retrieve_fuses_dense_and_lexical_rankings():
+    rag = TherapyRAG.__new__(TherapyRAG)
+    rag.vector_store = Mock()
+    rag.vector_store.get.return_value = {"ids": ["lexical-only"], "metadatas": [{"source": "b"}]}
+    dense = [
+        {"id": "generic", "metadata": {"source": "a"}, "distance": 0.2},
+        {"id": "both", "metadata": {"source": "a"}, "distance": 0.3},
+    ]
+    lexical = [("both", 9.0), ("lexical-only", 5.0)]
+    fused = rag._fuse_rankings(dense, lexical, 3)
+    assert [r["id"] for r in fused] == ["both", "generic", "lexical-only"]
+    assert fused[2]["metadata"] == {"source": "b"} and fused[2]["distance"] is None
+    rag.vector_store.get.assert_called_once_with(ids=["lexical-only"], include=["metadatas"])
+
+def test_mmr_select_skips_near_duplicates_and_caps_sources():
+    query = [1.0, 0.0, 0.0]
+    candidates = [[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7], [0.6, 0.8, 0.0]]
+    assert mmr_select(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+
+    sources = ["a", "b", "a", "b"]
+    assert mmr_select(query, candidates, 3, lambda_mult=1.0, sources=sources, max_per_source=1) == [0, 1]
+
+@pytest.mark.asyncio
+async def test_retrieve_caches_results_until_index_version_changes(tmp_path):
+    rag = TherapyRAG.__new__(TherapyRAG)
+    rag.logger = Mock()
+    rag.embed_query = AsyncMock(return_value=np.array([0.6, 0.8]))
+    rag.vector_store = Mock(version=0)
+    rag.vector_store.query.return_value = {"ids": [["p"]], "metadatas": [[{"source": "s"}]], "distances": [[0.1]]}
+    rag.lexical_index = MagicMock(version=0)
+    rag.lexical_index.__len__.return_value = 0
+    rag.quantized_index = Mock(loaded=False)
+    rag.document_store = DocumentStore(str(tmp_path / "documents.sqlite3"))
+    rag.document_store.put_many([("p", "some text")])
+    rag._index_generation = 0
+    rag.result_cache = RetrievalResultCache(max_size=10, ttl_seconds=60)
+
+    first = await rag.retrieve("I can't sleep", 1)
+    second = await rag.retrieve("I can't sleep", 1)
+    assert first == second == [{"id": "p", "metadata": {"source": "s"}, "distance": 0.1, "text": "some text"}]
+    assert rag.vector_store.query.call_count == 1
+
+    rag.vector_store.version += 1
+    await rag.retrieve("I can't sleep", 1)
+    assert rag.vector_store.query.call_count == 2
+    stats = rag.result_cache.get_stats()
+    assert (stats["hits"], stats["invalidations"]) == (1, 1)
+
+def test_quantized_index_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 64)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(500)]
+    index = QuantizedVectorIndex(str(tmp_path / "index"))
+    index.build(500, 64, ((ids[i:i + 100], vectors[i:i + 100]) for i in range(0, 500, 100)))
+
+    query = vectors[42] + 0.05 * rng.normal(size=64).astype(np.float32)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = [ids[i] for i in np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]]
+
+    reloaded = QuantizedVectorIndex(str(tmp_path / "index"))
+    reloaded.load()
+    results = reloaded.search(query, 5, binary_candidates=200, rerank_candidates=50)
+    assert [doc_id for doc_id, _ in results] == exact
+    assert results[0][1] < results[-1][1]
+
+def test_numpy_vector_store_upsert_query_and_reload(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(300)]
+    store = NumpyVectorStore(str(tmp_path / "store"), use_faiss=False)
+    store.add(ids, vectors, [f"text {i}" for i in range(300)], [{"source": "test", "i": i} for i in range(300)])
+    store.upsert(["doc-7", "doc-new"], vectors[[0, 1]], ["replaced", "new"], [{"source": "a"}, {"source": "b"}])
+    assert store.count() == 301
+
+    reloaded = NumpyVectorStore(str(tmp_path / "store"), use_faiss=False)
+    results = reloaded.query([vectors[0]], n_results=2, include=["documents", "metadatas", "distances"])
+    assert sorted(results["ids"][0]) == ["doc-0", "doc-7"]
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    fetched = reloaded.get(ids=["doc-new", "missing"], include=["documents"])
+    assert fetched == {"ids": ["doc-new"], "documents": ["new"]}
+    assert len(reloaded.get(include=[], limit=100, offset=250)["ids"]) == 51
+
+def fake_embedding_model():
+    model = Mock()
+    model.encode.side_effect = lambda texts: np.ones((len(texts), 3))
+    return model
+
+def spool_records(pipeline, dataset_name, texts):
+    with open(_spool_path(pipeline.spool_dir, dataset_name), "w") as f:
+        for text in texts:
+            doc = {"id": content_id(text), "text": text, "metadata": {"source": dataset_name}}
+            f.write(json.dumps(doc) + "\n")
+
+def test_ingestion_pipeline_resumes_from_checkpoint(tmp_path):
+    vector_store = Mock()
+    pipeline = IngestionPipeline(
+        vector_store=vector_store,
+        embedding_model=fake_embedding_model(),
+        work_dir=str(tmp_path),
+        document_store=DocumentStore(str(tmp_path / "documents.sqlite3")),
+        batch_size=2,
+        workers=1,
+        progress=Mock()
+    )
+    vector_store.get.return_value = {"ids": []}
+    # A previous run spooled five records and wrote the first batch before crashing
+    spool_records(pipeline, "test/dataset", [f"record {i}" for i in range(5)])
+    pipeline.checkpoint.update("test/dataset", spooled=5, records_done=2)
+
+    assert pipeline.run(["test/dataset"]) == 3
+    written = [i for call in vector_store.upsert.call_args_list for i in call.kwargs["ids"]]
+    assert written == [content_id(f"record {i}") for i in range(2, 5)]
+    assert all(call.kwargs["documents"] is None for call in vector_store.upsert.call_args_list)
+    assert pipeline.document_store.get_many(written) == {content_id(f"record {i}"): f"record {i}" for i in range(2, 5)}
+    assert not os.path.exists(pipeline.checkpoint.path)
+    pipeline.progress.assert_any_call("test/dataset", records_done=5, documents_added=1)
+    assert pipeline.progress.call_args == (("test/dataset",), {"status": "completed"})
+
+def test_ingestion_pipeline_skips_datasets_that_fail_to_load(tmp_path):
+    def iter_dataset(self, dataset_name, **kwargs):
+        if dataset_name == "bad/dataset":
+            raise ConnectionError("hub unavailable")
+        yield [{"text": "I feel anxious", "metadata": {"source": dataset_name}}]
+
+    vector_store = Mock()
+    vector_store.get.return_value = {"ids": []}
+    progress = Mock()
+    pipeline = IngestionPipeline(vector_store, fake_embedding_model(), str(tmp_path), workers=2, progress=progress)
+    # Loaders run in threads so the patched processor applies
+    with patch.object(ingestion, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+            patch("app.rag_system.TherapyDatasetProcessor.iter_dataset", iter_dataset):
+        assert pipeline.run(["good/dataset", "bad/dataset"]) == 1
+
+        assert pipeline.checkpoint.get("bad/dataset") == {"failed": True, "error": "hub unavailable"}
+        assert pipeline.checkpoint.get("good/dataset")["completed"]
+        assert not os.path.exists(_spool_path(pipeline.spool_dir, "bad/dataset") + ".tmp")
+        progress.assert_any_call("bad/dataset", status="failed", error="hub unavailable")
+
+        # Only failing datasets left: the run fails
+        with pytest.raises(RuntimeError):
+            pipeline.run(["good/dataset", "bad/dataset"])
+
+def test_ingestion_pipeline_skips_duplicate_and_indexed_texts(tmp_path):
+    vector_store = Mock()
+    vector_store.get.side_effect = lambda ids, include: {
+        "ids": [i for i in ids if i == content_id("already indexed")]
+    }
+    model = fake_embedding_model()
+    pipeline = IngestionPipeline(vector_store, model, str(tmp_path), batch_size=10, workers=1)
+    spool_records(pipeline, "first/dataset", ["I feel anxious", "already indexed"])
+    spool_records(pipeline, "second/dataset", ["  i feel  ANXIOUS ", "I can't sleep"])
+    for name in ("first/dataset", "second/dataset"):
+        pipeline.checkpoint.update(name, spooled=2, records_done=0)
+
+    assert pipeline.run(["first/dataset", "second/dataset"]) == 2
+    assert pipeline.duplicates_skipped == 1
+    assert pipeline.already_indexed == 1
+    assert sum(len(call.args[0]) for call in model.encode.call_args_list) == 2
+
+@pytest.mark.asyncio
+async def test_indexing_job_reports_progress_in_background():
+    manager = IndexingJobManager()
+    release = asyncio.Event()
+
+    async def run(job):
+        job.update("a/dataset", status="embedding", spooled=100, records_done=0)
+        job.update("b/dataset", status="loading")
+        job.update("a/dataset", records_done=40, documents_added=35)
+        await release.wait()
+
+    job = manager.start(run)
+    await asyncio.sleep(0.05)
+    assert manager.start(run) is job
+
+    status = job.to_dict()
+    assert status["status"] == "running"
+    assert (status["records_processed"], status["records_total"]) == (40, 100)
+    assert status["documents_indexed"] == 35 and status["datasets_loading"] == 1
+    assert status["eta_seconds"] > 0
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert job.to_dict()["status"] == "completed" and job.to_dict()["eta_seconds"] is None
+
+    async def fail(job):
+        raise RuntimeError("disk full")
+    failed = manager.start(fail)
+    await asyncio.sleep(0.05)
+    assert failed is not job and (failed.status, failed.error) == ("failed", "disk full")
+
@@ -0,0 +1,340 @@
+import asyncio
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import fakeredis
+from ..app.gemini_pool import GeminiClientPool
+from ..app.session_manager import SessionManager
+from ..app.session_store import (
+    InMemorySessionStore, RedisSessionStore, SessionConflictError, SQLiteSessionStore, decode_state, encode_state
+)
+
+def test_sessions_are_striped_across_shards():
+    manager = SessionManager(num_shards=8)
+    session_ids = [manager.create_session(user_id=f"user-{i}") for i in range(64)]
+
+    assert len(manager) == 64
+    assert sum(1 for shard in manager._shards if shard.sessions) > 1
+    metadata = manager.get_session_metadata(session_ids[0])
+    assert metadata["user_id"] == "user-0" and metadata["message_count"] == 0
+
+    # Callers get a copy, not the shard's dict
+    metadata["message_count"] = 99
+    manager.increment_message_count(session_ids[0])
+    assert manager.get_session_metadata(session_ids[0])["message_count"] == 1
+
+    assert manager.delete_session(session_ids[1])
+    assert manager.get_session(session_ids[1]) is None
+    assert manager.get_session_metadata(session_ids[1]) is None
+
+def test_cleanup_removes_inactive_sessions():
+    manager = SessionManager(num_shards=4)
+    stale, fresh = manager.create_session(), manager.create_session()
+    manager._shard(stale).metadata[stale]["last_activity"] = datetime.now() - timedelta(hours=48)
+
+    assert manager.cleanup_old_sessions(max_age_hours=24) == 1
+    assert manager.get_session(stale) is None
+    assert manager.get_session(fresh) is not None
+
+@pytest.mark.asyncio
+async def test_session_lock_keeps_concurrent_turns_in_order():
+    async def generate(contents, **kwargs):
+        await asyncio.sleep(0.05)
+        return Mock(text="reply", usage_metadata=None)
+
+    pool = GeminiClientPool(api_key="test-key", max_concurrency=8)
+    pool.get_model = Mock(return_value=Mock(generate_content_async=generate))
+    manager = SessionManager(num_shards=4)
+    session_id = manager.create_session()
+    therapist = manager.get_session(session_id)
+    therapist.client_pool = pool
+
+    async def send(message):
+        async with manager.session_lock(session_id):
+            await therapist.chat(message, use_rag=False)
+
+    await asyncio.gather(send("first"), send("second"))
+    history = [(m["role"], m["content"]) for m in therapist.get_conversation_history()]
+    assert history == [("user", "first"), ("assistant", "reply"), ("user", "second"), ("assistant", "reply")]
+    assert manager.session_lock(session_id) is manager.session_lock(session_id)
+
+@pytest.mark.asyncio
+async def test_unknown_sessions_leave_no_turn_locks_behind():
+    manager = SessionManager(num_shards=4)
+    for i in range(10):
+        async with manager.session_lock(f"missing-{i}"):
+            assert manager.get_session(f"missing-{i}") is None
+    assert all(not shard.turn_locks for shard in manager._shards)
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite", "redis"])
+def test_session_store_round_trip(backend, tmp_path):
+    store = {
+        "memory": lambda: InMemorySessionStore(),
+        "sqlite": lambda: SQLiteSessionStore(str(tmp_path / "sessions.sqlite3")),
+        "redis": lambda: RedisSessionStore(client=fakeredis.FakeRedis())
+    }[backend]()
+    now = datetime.now()
+    state = {"history": [["user", "hello", now.timestamp()]], "summary": None}
+
+    store.save("s1", {"created_at": now, "last_activity": now, "message_count": 1}, encode_state(state), 3)
+    metadata, blob, version = store.load("s1")
+    assert decode_state(blob) == state and version == 3
+    assert metadata["created_at"] == now and metadata["message_count"] == 1
+    assert store.get_version("s1") == 3
+    assert set(store.list_metadata()) == {"s1"}
+
+    assert store.delete("s1")
+    assert store.load("s1") is None and store.get_version("s1") is None
+    assert not store.delete("s1")
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite", "redis"])
+def test_session_store_conditional_save(backend, tmp_path):
+    store = {
+        "memory": lambda: InMemorySessionStore(),
+        "sqlite": lambda: SQLiteSessionStore(str(tmp_path / "sessions.sqlite3")),
+        "redis": lambda: RedisSessionStore(client=fakeredis.FakeRedis())
+    }[backend]()
+    now = datetime.now()
+    metadata = {"created_at": now, "last_activity": now, "message_count": 0}
+    store.save("s1", metadata, encode_state({"history": []}), 1)
+
+    store.save("s1", metadata, encode_state({"history": []}), 2, expected_version=1)
+    # A second writer that also loaded version 1 loses
+    with pytest.raises(SessionConflictError):
+        store.save("s1", metadata, encode_state({"history": []}), 2, expected_version=1)
+    assert store.get_version("s1") == 2
+
+    store.delete("s1")
+    with pytest.raises(SessionConflictError):
+        store.save("s1", metadata, encode_state({"history": []}), 3, expected_version=2)
+    assert store.load("s1") is None
+
+def test_resident_sessions_skip_version_checks_on_a_local_store():
+    store = InMemorySessionStore()
+    manager = SessionManager(num_shards=2, store=store)
+    session_id = manager.create_session()
+
+    store.get_version = Mock(side_effect=AssertionError("no round trip expected"))
+    assert manager.get_session(session_id) is not None
+
+@pytest.mark.asyncio
+async def test_sessions_rehydrate_across_managers(tmp_path):
+    async def generate(contents, **kwargs):
+        return Mock(text="reply", usage_metadata=None)
+
+    pool = GeminiClientPool(api_key="test-key")
+    pool.get_model = Mock(return_value=Mock(generate_content_async=generate))
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    first, second = SessionManager(num_shards=4, store=store), SessionManager(num_shards=4, store=store)
+
+    session_id = first.create_session(user_id="alice")
+    therapist = first.get_session(session_id)
+    therapist.client_pool = pool
+    await therapist.chat("hello", use_rag=False)
+    first.increment_message_count(session_id)
+
+    # The second worker has never seen the session and restores it lazily
+    assert len(second) == 0
+    restored = second.get_session(session_id)
+    assert [m["content"] for m in restored.get_conversation_history()] == ["hello", "reply"]
+    assert second.get_session_metadata(session_id)["message_count"] == 1
+
+    # A turn on the second worker makes the first worker's copy stale
+    restored.client_pool = pool
+    await restored.chat("again", use_rag=False)
+    second.increment_message_count(session_id)
+    refreshed = first.get_session(session_id)
+    assert refreshed is not therapist
+    assert len(refreshed.get_conversation_history()) == 4
+
+    assert second.delete_session(session_id)
+    assert first.get_session(session_id) is None
+
+def test_concurrent_saves_from_two_workers_conflict(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    first, second = SessionManager(num_shards=4, store=store), SessionManager(num_shards=4, store=store)
+    session_id = first.create_session()
+    assert second.get_session(session_id) is not None
+
+    # Both workers hold version 1; only the first save of version 2 lands
+    first.increment_message_count(session_id)
+    with pytest.raises(SessionConflictError):
+        second.increment_message_count(session_id)
+    assert store.get_version(session_id) == 2
+
+    # The loser dropped its stale copy and reloads the winner's state
+    assert len(second) == 0
+    assert second.get_session(session_id) is not None
+    assert second.get_session_metadata(session_id)["message_count"] == 1
+
+def test_reaper_expires_idle_sessions_in_deadline_order():
+    manager = SessionManager(num_shards=4, ttl_seconds=60)
+    idle, active = manager.create_session(), manager.create_session()
+    now = time.time()
+
+    # Activity moves the deadline without adding heap entries
+    later = datetime.fromtimestamp(now + 50)
+    shard = manager._shard(active)
+    with shard.lock:
+        manager._touch(shard, active, later)
+    assert manager.get_stats()["expiry_heap_entries"] == 2
+
+    assert manager.reap_expired(now=now + 30) == 0
+    assert manager.reap_expired(now=now + 61) == 1
+    assert manager.get_session(idle) is None
+    assert manager.get_session_metadata(active) is not None
+
+    stats = manager.get_stats()
+    assert stats["expired_sessions"] == 1 and stats["reaper_runs"] == 2
+    assert stats["tracked_sessions"] == stats["expiry_heap_entries"] == 1
+
+@pytest.mark.asyncio
+async def test_reaper_survives_a_failing_first_sweep():
+    manager = SessionManager(num_shards=2, store=InMemorySessionStore())
+    manager.cleanup_old_sessions = Mock(side_effect=[RuntimeError("store unavailable"), 0])
+    manager.reap_expired = Mock(return_value=0)
+
+    manager.start_reaper(interval=0.01)
+    await asyncio.sleep(0.1)
+    assert not manager._reaper_task.done()
+    await manager.stop_reaper()
+
+    # The startup sweep is retried, then regular reaping takes over
+    assert manager.cleanup_old_sessions.call_count == 2
+    assert manager.reap_expired.call_count > 0
+
+@pytest.mark.asyncio
+async def test_least_recently_active_sessions_spill_and_restore(tmp_path):
+    async def generate(contents, **kwargs):
+        return Mock(text="reply", usage_metadata=None)
+
+    pool = GeminiClientPool(api_key="test-key")
+    pool.get_model = Mock(return_value=Mock(generate_content_async=generate))
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    manager = SessionManager(num_shards=1, store=store, max_resident=2)
+
+    oldest = manager.create_session()
+    therapist = manager.get_session(oldest)
+    therapist.client_pool = pool
+    await therapist.chat("remember me", use_rag=False)
+    manager.increment_message_count(oldest)
+
+    newer = [manager.create_session() for _ in range(2)]
+    assert len(manager) == 2
+    assert oldest not in manager._shards[0].sessions
+    assert manager.get_session_metadata(oldest)["message_count"] == 1
+
+    # History is served from the spilled copy, evicting the next oldest session
+    history = manager.get_session_history(oldest)
+    assert [m["content"] for m in history] == ["remember me", "reply"]
+    assert len(manager) == 2 and newer[0] not in manager._shards[0].sessions
+
+    stats = manager.get_stats()
+    assert stats["spilled_sessions"] == 2 and stats["restored_sessions"] == 1
+    assert stats["average_restore_ms"] > 0
+
+@pytest.mark.asyncio
+async def test_sessions_in_a_turn_are_not_spilled():
+    manager = SessionManager(num_shards=1, max_resident=1, store=InMemorySessionStore())
+    busy = manager.create_session()
+
+    async with manager.session_lock(busy):
+        idle = manager.create_session()
+        assert busy in manager._shards[0].sessions and idle in manager._shards[0].sessions
+
+    manager.create_session()
+    assert busy not in manager._shards[0].sessions
+
+@pytest.mark.parametrize("num_shards,max_resident", [(32, 10), (4, 10), (8, 8)])
+def test_resident_cap_holds_across_shards(num_shards, max_resident):
+    manager = SessionManager(num_shards=num_shards, max_resident=max_resident, store=InMemorySessionStore())
+    assert sum(shard.max_resident for shard in manager._shards) == max_resident
+    assert all(shard.max_resident > 0 for shard in manager._shards)
+
+    for _ in range(100):
+        manager.create_session()
+    assert len(manager) <= max_resident
+
+def test_sessions_with_a_pending_summary_are_not_spilled():
+    manager = SessionManager(num_shards=1, max_resident=1, store=InMemorySessionStore())
+    summarizing = manager.create_session()
+    therapist = manager.get_session(summarizing)
+    therapist.summary_pending = Mock(return_value=True)
+
+    manager.create_session()
+    assert summarizing in manager._shards[0].sessions
+
+    therapist.summary_pending.return_value = False
+    manager.create_session()
+    assert summarizing not in manager._shards[0].sessions
+
+def test_restore_waits_for_an_in_flight_spill(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    manager = SessionManager(num_shards=1, store=store, max_resident=1)
+    first = manager.create_session()
+    shard = manager._shards[0]
+    # Activity since the last turn that only the spill writes back
+    shard.metadata[first]["message_count"] = 5
+
+    release = threading.Event()
+    save = store.save
+    def slow_save(session_id, *args, **kwargs):
+        if session_id == first:
+            release.wait(5)
+        save(session_id, *args, **kwargs)
+    store.save = slow_save
+
+    spiller = threading.Thread(target=manager.create_session)
+    spiller.start()
+    while first not in shard.spilling:
+        time.sleep(0.001)
+    reader = threading.Thread(target=manager.get_session, args=(first,))
+    reader.start()
+    time.sleep(0.05)
+    # The stored copy is still the older one, so the reader must not load it
+    assert reader.is_alive() and first not in shard.sessions
+
+    release.set()
+    spiller.join()
+    reader.join()
+    assert not shard.spilling
+    assert shard.versions[first] == store.get_version(first) == 2
+    assert manager.get_session_metadata(first)["message_count"] == 5
+
+@pytest.mark.asyncio
+async def test_turn_waiting_for_its_lock_survives_spill_and_restore(tmp_path):
+    async def generate(contents, **kwargs):
+        await asyncio.sleep(0.01)
+        return Mock(text="reply", usage_metadata=None)
+
+    pool = GeminiClientPool(api_key="test-key")
+    pool.get_model = Mock(return_value=Mock(generate_content_async=generate))
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    manager = SessionManager(num_shards=1, store=store, max_resident=1)
+    session_id = manager.create_session()
+
+    # Same sequence as the chat handler
+    async def turn(message):
+        async with manager.session_lock(session_id):
+            therapist = manager.get_session(session_id)
+            therapist.client_pool = pool
+            await therapist.chat(message, use_rag=False)
+            manager.increment_message_count(session_id)
+
+    lock = manager.session_lock(session_id)
+    await lock.acquire()
+    waiting = asyncio.create_task(turn("B message"))
+    await asyncio.sleep(0)
+    lock.release()
+
+    # Before the waiter wakes, another session spills this one and a new
+    # request restores it
+    manager.create_session()
+    assert session_id not in manager._shards[0].sessions
+    await asyncio.gather(waiting, turn("C message"))
+
+    history = [m["content"] for m in manager.get_session_history(session_id)]
+    assert history == ["B message", "reply", "C message", "reply"]
+    assert manager.get_session_metadata(session_id)["message_count"] == 2
@@ -0,0 +1,148 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import Mock
+from ..app.context_window import ContextWindowManager, estimate_tokens
+from ..app.gemini_pool import GeminiClientPool, get_client_pool
+from ..app.response_cache import SemanticResponseCache
+from ..app.therapist import GeminiTherapist
+
+def mock_model(generate):
+    model = Mock()
+    model.generate_content_async = generate
+    model.start_chat.side_effect = lambda history: Mock(
+        send_message_async=generate,
+        history=list(history)
+    )
+    return model
+
+def mock_reply(text: str = "I hear you.", delay: float = 0.0):
+    async def generate(contents, **kwargs):
+        await asyncio.sleep(delay)
+        return Mock(text=text, usage_metadata=None)
+    return generate
+
+@pytest.fixture
+def client_pool():
+    pool = GeminiClientPool(api_key="test-key", max_concurrency=8)
+    pool.get_model = Mock(return_value=mock_model(mock_reply()))
+    return pool
+
+@pytest.fixture
+def therapist(client_pool):
+    return GeminiTherapist(client_pool=client_pool)
+
+@pytest.mark.asyncio
+async def test_chat_records_history(therapist):
+    result = await therapist.chat("I feel anxious", use_rag=False)
+    assert result["response"] == "I hear you."
+    assert [m["role"] for m in therapist.get_conversation_history()] == ["user", "assistant"]
+
+@pytest.mark.asyncio
+async def test_chat_does_not_block_event_loop(therapist, client_pool):
+    client_pool.get_model.return_value = mock_model(mock_reply(delay=0.2))
+    start = time.perf_counter()
+    await asyncio.gather(*(therapist.chat("Hello", use_rag=False) for _ in range(5)))
+    assert time.perf_counter() - start < 0.5
+
+@pytest.mark.asyncio
+async def test_chat_stream_emits_sources_first(therapist, client_pool):
+    async def generate(contents, stream=False, **kwargs):
+        async def chunks():
+            for text in ["I hear ", "you."]:
+                yield Mock(text=text, usage_metadata=None)
+        return chunks()
+    client_pool.get_model.return_value = mock_model(generate)
+
+    events = [event async for event in therapist.chat_stream("I feel anxious", use_rag=False)]
+    assert [e["event"] for e in events] == ["sources", "token", "token", "done"]
+    assert therapist.get_conversation_history()[-1]["content"] == "I hear you."
+
+@pytest.mark.asyncio
+async def test_stateless_contents_send_each_turn_once(therapist):
+    for message in ["Hello", "I can't sleep", "Work is stressful"]:
+        await therapist.chat(message, use_rag=False)
+
+    window = therapist.context_manager.build(
+        system_prompt="System",
+        user_message="What should I do?",
+        history=therapist.conversation_history,
+        examples=[{"text": "some example", "metadata": {"source": "test_dataset"}}]
+    )
+    contents = therapist._build_contents(window)
+    assert [c["role"] for c in contents] == ["user", "model"] * 3 + ["user"]
+    assert sum("Reference Examples" in part for c in contents for part in c["parts"]) == 1
+    assert not any("compassionate" in part for c in contents for part in c["parts"])
+
+@pytest.mark.asyncio
+async def test_long_sessions_fold_into_running_summary(therapist):
+    for i in range(7):
+        await therapist.chat(f"Message {i}", use_rag=False)
+    await therapist._summary_task
+
+    assert therapist.running_summary == "I hear you."
+    assert len(therapist._unsummarized_history()) == 6
+    assert await therapist.get_conversation_summary() == "I hear you."
+
+    request, _ = await therapist._prepare_message("Next", use_rag=False, n_examples=3)
+    assert request[0]["parts"][0].startswith("Summary of our earlier conversation")
+    assert not any("Message 0" in part for c in request for part in c["parts"])
+
+def test_sessions_share_client_pool():
+    first = GeminiTherapist(gemini_api_key="test-key")
+    second = GeminiTherapist(gemini_api_key="test-key")
+    assert first.client_pool is second.client_pool is get_client_pool()
+    assert first.client_pool.get_model() is second.client_pool.get_model()
+
+def test_context_window_keeps_recent_turns_within_budget():
+    manager = ContextWindowManager(token_budget=150, token_counter=estimate_tokens)
+    history = [{"role": "user", "content": "x" * 400}] + [
+        {"role": "assistant" if i % 2 else "user", "content": f"short turn {i}"}
+        for i in range(10)
+    ]
+    window = manager.build("System prompt", "How do I cope?", history)
+    assert window.token_count <= 150
+    assert window.turns == history[1:]
+    assert window.dropped_turns == 1
+
+def test_context_window_admits_examples_after_history():
+    manager = ContextWindowManager(token_budget=60, token_counter=estimate_tokens)
+    history = [{"role": "user", "content": "y" * 120}]
+    examples = [
+        {"text": "z" * 200, "metadata": {"source": "long"}},
+        {"text": "short example", "metadata": {"source": "short"}}
+    ]
+    window = manager.build("System", "Hello", history, examples)
+    assert window.turns == history
+    assert [e["metadata"]["source"] for e in window.examples] == ["short"]
+
+@pytest.mark.asyncio
+async def test_semantic_cache_serves_opening_messages_but_not_crises(client_pool):
+    calls = []
+    async def generate(contents, **kwargs):
+        calls.append(contents)
+        return Mock(text=f"reply {len(calls)}", usage_metadata=None)
+    client_pool.get_model.return_value = mock_model(generate)
+
+    embeddings = {"hi there": [1.0, 0.0], "Hi there!": [0.99, 0.05], "i want to kill myself": [1.0, 0.01]}
+    rag_system = Mock()
+    async def embed_query(message):
+        return embeddings.get(message.lower(), embeddings.get(message))
+    rag_system.embed_query = embed_query
+    cache = SemanticResponseCache(max_size=10, ttl_seconds=60, threshold=0.9)
+
+    def session():
+        return GeminiTherapist(client_pool=client_pool, rag_system=rag_system, response_cache=cache)
+
+    first = await session().chat("hi there", use_rag=False)
+    second_session = session()
+    second = await second_session.chat("Hi there!", use_rag=False)
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["response"] == "reply 1" and len(calls) == 1
+    assert [m["role"] for m in second_session.get_conversation_history()] == ["user", "assistant"]
+
+    # Follow-up turns and crisis messages always reach the model
+    await second_session.chat("hi there", use_rag=False)
+    crisis = await session().chat("I want to kill myself", use_rag=False)
+    assert crisis["cached"] is False and len(calls) == 3
+    assert cache.get_stats()["size"] == 1